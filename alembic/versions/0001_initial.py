@@ -0,0 +1,45 @@
+"""Initial users table
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-12-01 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("telegram_id", sa.BigInteger(), nullable=False),
+        sa.Column("daily_enabled", sa.Boolean(), nullable=False),
+        sa.Column("daily_hour", sa.Integer(), nullable=False),
+        sa.Column("daily_minute", sa.Integer(), nullable=False),
+        sa.Column("alert_enabled", sa.Boolean(), nullable=False),
+        sa.Column("alert_threshold", sa.Integer(), nullable=False),
+        sa.Column("last_aqi_level", sa.String(length=20), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+        ),
+        sa.Column(
+            "updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_users_telegram_id"), "users", ["telegram_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_users_telegram_id"), table_name="users")
+    op.drop_table("users")
@@ -0,0 +1,127 @@
+"""Scheduler indexes, AQI history, FSM storage, notification outbox and API usage
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Users: partial indexes for the scheduler
+    op.create_index(
+        "ix_users_daily_schedule",
+        "users",
+        ["daily_hour", "daily_minute"],
+        postgresql_where=sa.text("daily_enabled"),
+        sqlite_where=sa.text("daily_enabled"),
+    )
+    op.create_index(
+        "ix_users_alert_threshold",
+        "users",
+        ["location", "alert_threshold", "last_aqi_level"],
+        postgresql_where=sa.text("alert_enabled"),
+        sqlite_where=sa.text("alert_enabled"),
+    )
+    op.create_index(
+        "ix_users_alert_level",
+        "users",
+        ["location", "last_aqi_level"],
+        postgresql_where=sa.text("alert_enabled"),
+        sqlite_where=sa.text("alert_enabled"),
+    )
+
+    # AQI history
+    op.create_table(
+        "aqi_readings",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("location", sa.String(length=32), nullable=False),
+        sa.Column("aqi", sa.Integer(), nullable=False),
+        sa.Column("main_pollutant", sa.String(length=8), nullable=False),
+        sa.Column("measured_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_aqi_readings_location_measured_at", "aqi_readings", ["location", "measured_at"]
+    )
+    for table in ("aqi_hourly", "aqi_daily"):
+        op.create_table(
+            table,
+            sa.Column("location", sa.String(length=32), nullable=False),
+            sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("samples", sa.Integer(), nullable=False),
+            sa.Column("aqi_sum", sa.Integer(), nullable=False),
+            sa.Column("aqi_min", sa.Integer(), nullable=False),
+            sa.Column("aqi_max", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("location", "bucket"),
+        )
+
+    op.create_table(
+        "api_usage",
+        sa.Column("api", sa.String(length=32), nullable=False),
+        sa.Column("period", sa.String(length=16), nullable=False),
+        sa.Column("calls", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("api", "period"),
+    )
+
+    op.create_table(
+        "fsm_storage",
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("state", sa.String(length=255), nullable=True),
+        sa.Column("data", sa.JSON(), nullable=False),
+        sa.Column(
+            "updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("key"),
+    )
+
+    op.create_table(
+        "notification_outbox",
+        sa.Column(
+            "id", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), nullable=False
+        ),
+        sa.Column("chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("kind", sa.String(length=16), nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_error", sa.String(length=255), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+        ),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_notification_outbox_pending",
+        "notification_outbox",
+        ["next_attempt_at"],
+        postgresql_where=sa.text("status = 'pending'"),
+        sqlite_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_notification_outbox_pending", table_name="notification_outbox")
+    op.drop_table("notification_outbox")
+    op.drop_table("fsm_storage")
+    op.drop_table("api_usage")
+    op.drop_table("aqi_daily")
+    op.drop_table("aqi_hourly")
+    op.drop_index("ix_aqi_readings_location_measured_at", table_name="aqi_readings")
+    op.drop_table("aqi_readings")
+    op.drop_index("ix_users_alert_level", table_name="users")
+    op.drop_index("ix_users_alert_threshold", table_name="users")
+    op.drop_index("ix_users_daily_schedule", table_name="users")
@@ -0,0 +1,39 @@
+"""One AQI reading per location and measurement time
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keep the first copy of readings stored more than once
+    op.execute(
+        "DELETE FROM aqi_readings WHERE id NOT IN "
+        "(SELECT MIN(id) FROM aqi_readings GROUP BY location, measured_at)"
+    )
+    op.drop_index("ix_aqi_readings_location_measured_at", table_name="aqi_readings")
+    op.create_index(
+        "ix_aqi_readings_location_measured_at",
+        "aqi_readings",
+        ["location", "measured_at"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_aqi_readings_location_measured_at", table_name="aqi_readings")
+    op.create_index(
+        "ix_aqi_readings_location_measured_at", "aqi_readings", ["location", "measured_at"]
+    )
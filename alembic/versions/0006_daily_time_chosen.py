@@ -0,0 +1,34 @@
+"""Whether the user picked the daily notification time
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("daily_time_chosen", sa.Boolean(), server_default=sa.false(), nullable=False),
+    )
+    # Before, only a time other than the default 08:00 counted as chosen
+    op.execute(
+        "UPDATE users SET daily_time_chosen = true WHERE daily_hour != 8 OR daily_minute != 0"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("daily_time_chosen")
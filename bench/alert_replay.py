@@ -0,0 +1,289 @@
+"""Alert decision replay
+
+Feeds a recorded or synthetic AQI series through the alert engine for a
+synthetic user population, without a database or Telegram, and reports how
+many alerts users would get, the decision throughput and where engine
+versions disagree:
+
+    python -m bench.alert_replay --users 10000 --days 30 --engine current --engine legacy
+    python -m bench.alert_replay --series readings.csv --engine current --engine git:HEAD~3
+
+A recorded series is a CSV with measured_at,location,aqi columns, e.g.:
+
+    COPY (SELECT measured_at, location, aqi FROM aqi_readings ORDER BY 1) TO STDOUT CSV HEADER
+
+Engines:
+  current    bot/services/alerts.py as in the working tree
+  git:<rev>  bot/services/alerts.py at a git revision
+  legacy     the per-user rule used before alerts.py, evaluated on every check
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import types
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from bench.scheduler_bench import LOCATIONS, percentile, synthetic_users
+
+# Typical level per city, Almaty winters are the smoggiest
+BASE_AQI = {"almaty": 120, "astana": 70, "shymkent": 90}
+
+LEGACY_BAD_LEVELS = ("unhealthy_sensitive", "unhealthy", "very_unhealthy", "hazardous")
+
+
+@dataclass
+class Tick:
+    """One scheduler check of a location, ``new`` when a measurement was published"""
+
+    measured_at: datetime
+    location: str
+    aqi: int
+    new: bool
+
+
+@dataclass
+class Engine:
+    name: str
+    alert_level: Callable[[int], str]
+    decide: Callable[[int, int, str | None], str | None]  # aqi, threshold, last level
+    # Like the scheduler: only new measurements that change the
+    # location's level are evaluated and only alerted users move to it. The legacy
+    # engine checks and moves every user each tick.
+    transitions_only: bool = True
+
+
+@dataclass
+class Result:
+    engine: str
+    per_user: list[int]
+    by_type: Counter = field(default_factory=Counter)
+    evaluations: int = 0
+    seconds: float = 0.0
+    # user index -> [(tick index, alert type)] for the users sampled for diffs
+    log: dict[int, list[tuple[int, str]]] = field(default_factory=lambda: defaultdict(list))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--series", help="CSV with measured_at,location,aqi, synthetic if unset")
+    parser.add_argument("--days", type=int, default=30, help="length of the synthetic series")
+    parser.add_argument(
+        "--checks-per-reading",
+        type=int,
+        default=12,
+        help="scheduler checks per hourly measurement, 12 for ALERTS_CHECK_MINUTES=5",
+    )
+    parser.add_argument(
+        "--engine",
+        action="append",
+        help="current, legacy or git:<rev>; repeat to compare, defaults to current",
+    )
+    parser.add_argument("--diff-sample", type=int, default=1000, help="users logged for diffs")
+    parser.add_argument("--diff-examples", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def configure_env() -> None:
+    """Settings are read on import, so this must run before importing bot modules"""
+    os.environ.setdefault("BOT_TOKEN", "42:replay")
+    os.environ.setdefault("IQAIR_API_KEY", "replay")
+    os.environ.setdefault("POSTGRES_PASSWORD", "replay")
+    # Never connected to, the engine only needs a driver that is installed
+    os.environ.setdefault(
+        "DATABASE_DSN", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/almaty_air_replay.db"
+    )
+
+
+def load_engine(spec: str) -> Engine:
+    if spec == "current":
+        from bot.services import alerts
+
+        return Engine(spec, alerts.alert_level, alerts.decide_alert)
+
+    if spec == "legacy":
+        from bot.services.alerts import alert_level
+
+        def legacy_decide(aqi: int, threshold: int, last_level: str | None) -> str | None:
+            if aqi >= threshold:
+                return "warning" if last_level != alert_level(aqi) else None
+            if last_level in LEGACY_BAD_LEVELS:
+                return "improved"
+            return None
+
+        return Engine(spec, alert_level, legacy_decide, transitions_only=False)
+
+    if spec.startswith("git:"):
+        rev = spec.removeprefix("git:")
+        try:
+            source = subprocess.run(
+                ["git", "show", f"{rev}:bot/services/alerts.py"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        except subprocess.CalledProcessError as e:
+            raise SystemExit(f"Can't load alerts.py at {rev}: {e.stderr.strip()}")
+
+        module = types.ModuleType(f"alerts_{rev}")
+        exec(compile(source, f"{rev}:bot/services/alerts.py", "exec"), module.__dict__)
+        return Engine(spec, module.alert_level, module.decide_alert)
+
+    raise SystemExit(f"Unknown engine {spec!r}, expected current, legacy or git:<rev>")
+
+
+def expand(readings: list[tuple[datetime, str, int]], checks: int) -> list[Tick]:
+    """Turn measurements into scheduler checks, repeating each until the next one"""
+    ticks = []
+    for measured_at, location, aqi in sorted(readings):
+        ticks.append(Tick(measured_at, location, aqi, True))
+        step = timedelta(hours=1) / checks
+        ticks.extend(Tick(measured_at + step * i, location, aqi, False) for i in range(1, checks))
+    ticks.sort(key=lambda t: t.measured_at)
+    return ticks
+
+
+def read_series(path: str) -> list[tuple[datetime, str, int]]:
+    with open(path, newline="") as f:
+        return [
+            (datetime.fromisoformat(row["measured_at"]), row["location"], int(row["aqi"]))
+            for row in csv.DictReader(f)
+        ]
+
+
+def synthetic_series(days: int, rng: random.Random) -> list[tuple[datetime, str, int]]:
+    # Daily cycle with an evening peak plus slowly drifting weather
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    readings = []
+    for location, base in BASE_AQI.items():
+        drift = 0.0
+        for hour in range(days * 24):
+            drift = 0.9 * drift + rng.gauss(0, 12)
+            cycle = 0.35 * base * math.sin((hour % 24 - 9) / 24 * 2 * math.pi)
+            aqi = max(5, min(500, round(base + cycle + drift)))
+            readings.append((start + timedelta(hours=hour), location, aqi))
+    return readings
+
+
+def replay(engine: Engine, ticks: list[Tick], users: list[dict], sample: set[int]) -> Result:
+    result = Result(engine.name, [0] * len(users))
+
+    # Columns per location, the layout the recipient query works on
+    members: dict[str, list[int]] = defaultdict(list)
+    for i, user in enumerate(users):
+        members[user["location"]].append(i)
+    thresholds = {loc: [users[i]["alert_threshold"] for i in ids] for loc, ids in members.items()}
+    levels = {loc: [users[i]["last_aqi_level"] for i in ids] for loc, ids in members.items()}
+    location_levels: dict[str, str] = {}
+
+    decide = engine.decide
+    per_user, by_type, log = result.per_user, result.by_type, result.log
+    started = time.perf_counter()
+    for t, tick in enumerate(ticks):
+        level = engine.alert_level(tick.aqi)
+        if engine.transitions_only:
+            if not tick.new or location_levels.get(tick.location) == level:
+                continue
+            location_levels[tick.location] = level
+
+        ids = members.get(tick.location, [])
+        user_levels = levels.get(tick.location, [])
+        for j, threshold in enumerate(thresholds.get(tick.location, [])):
+            alert = decide(tick.aqi, threshold, user_levels[j])
+            # The scheduler only moves users who get an alert, legacy moved everyone
+            if alert or not engine.transitions_only:
+                user_levels[j] = level
+            if alert:
+                user = ids[j]
+                per_user[user] += 1
+                by_type[alert] += 1
+                if user in sample:
+                    log[user].append((t, alert))
+        result.evaluations += len(ids)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def print_summary(results: list[Result], ticks: list[Tick]) -> None:
+    header = (
+        f"{'engine':<16}{'alerts':>9}{'warning':>9}{'improved':>9}{'users>0':>9}"
+        f"{'mean':>7}{'p50':>6}{'p95':>6}{'max':>6}{'evals':>11}{'evals/s':>12}"
+    )
+    print(f"{len(ticks)} checks, {sum(t.new for t in ticks)} measurements")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        counts = [float(c) for c in r.per_user]
+        print(
+            f"{r.engine:<16}{sum(r.per_user):>9}{r.by_type['warning']:>9}"
+            f"{r.by_type['improved']:>9}{sum(c > 0 for c in r.per_user):>9}"
+            f"{statistics.fmean(counts) if counts else 0:>7.1f}"
+            f"{percentile(counts, 50):>6.0f}{percentile(counts, 95):>6.0f}"
+            f"{max(r.per_user, default=0):>6}{r.evaluations:>11}"
+            f"{r.evaluations / r.seconds if r.seconds else 0:>12.0f}"
+        )
+
+
+def print_diff(
+    base: Result, other: Result, ticks: list[Tick], users: list[dict], examples: int
+) -> None:
+    changed = sum(a != b for a, b in zip(base.per_user, other.per_user))
+    print(
+        f"\n{base.engine} vs {other.engine}: {changed} users get a different number of "
+        f"alerts ({sum(other.per_user) - sum(base.per_user):+d} in total)"
+    )
+
+    shown = 0
+    for user in sorted(set(base.log) | set(other.log)):
+        only_base = sorted(set(base.log[user]) - set(other.log[user]))
+        only_other = sorted(set(other.log[user]) - set(base.log[user]))
+        if not only_base and not only_other:
+            continue
+        t, alert = min(only_base + only_other)
+        tick = ticks[t]
+        engine = base.engine if (t, alert) in only_base else other.engine
+        print(
+            f"  user {user} ({users[user]['location']}, threshold "
+            f"{users[user]['alert_threshold']}): first diff at {tick.measured_at:%Y-%m-%d %H:%M} "
+            f"AQI {tick.aqi}, {alert} only from {engine}; "
+            f"{len(only_base)} vs {len(only_other)} unmatched alerts"
+        )
+        shown += 1
+        if shown >= examples:
+            break
+
+
+def main() -> None:
+    args = parse_args()
+    configure_env()
+    rng = random.Random(args.seed)
+
+    engines = [load_engine(spec) for spec in args.engine or ["current"]]
+    readings = read_series(args.series) if args.series else synthetic_series(args.days, rng)
+    ticks = expand(readings, args.checks_per_reading)
+    users = [u for u in synthetic_users(args.users, rng) if u["alert_enabled"]]
+    sample = set(rng.sample(range(len(users)), min(args.diff_sample, len(users))))
+
+    unknown = {t.location for t in ticks} - set(LOCATIONS)
+    if unknown:
+        print(f"No synthetic users in {', '.join(sorted(unknown))}, their readings are ignored")
+
+    results = [replay(engine, ticks, users, sample) for engine in engines]
+    print_summary(results, ticks)
+    for other in results[1:]:
+        print_diff(results[0], other, ticks, users, args.diff_examples)
+
+
+if __name__ == "__main__":
+    main()
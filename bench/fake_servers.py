@@ -0,0 +1,100 @@
+"""Local stand-ins for the Telegram Bot API and the IQAir /v2/city endpoint"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    """Answers sendMessage with configurable latency and 429 rate"""
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.sent = 0
+        self.rejected = 0
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = await request.post()
+        await asyncio.sleep(self.latency)
+
+        if method.lower() != "sendmessage":
+            return web.json_response({"ok": True, "result": True})
+
+        if random.random() < self.error_rate:
+            self.rejected += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+
+        self.sent += 1
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": self.sent,
+                    "date": int(time.time()),
+                    "chat": {"id": int(form["chat_id"]), "type": "private"},
+                    "text": form.get("text", ""),
+                },
+            }
+        )
+
+
+class FakeIQAir:
+    """Serves /v2/city with a configurable AQI and measurement time"""
+
+    def __init__(self, aqi: int = 80, latency: float = 0.1):
+        self.aqi = aqi
+        self.measured_at = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        self.latency = latency
+        self.requests = 0
+        self.app = web.Application()
+        self.app.router.add_get("/v2/city", self.handle)
+
+    def publish(self, aqi: int) -> None:
+        """Serve a new hourly measurement"""
+        self.aqi = aqi
+        self.measured_at += timedelta(hours=1)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response(
+            {
+                "status": "success",
+                "data": {
+                    "current": {
+                        "pollution": {
+                            "ts": self.measured_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                            "aqius": self.aqi,
+                            "mainus": "p2",
+                        },
+                        "weather": {"tp": 5, "hu": 60, "ws": 2.1, "pr": 1015},
+                    }
+                },
+            }
+        )
+
+
+async def serve(app: web.Application, port: int = 0) -> tuple[web.AppRunner, str]:
+    """Start the app on localhost, returning the runner and its base URL"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
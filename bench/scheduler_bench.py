@@ -0,0 +1,237 @@
+"""Scheduler broadcast benchmark
+
+Seeds a local database with N synthetic users, runs both NotificationScheduler
+jobs against fake Telegram and IQAir servers and reports throughput,
+per-message latency, peak memory and DB query counts. Runs fully offline:
+
+    python -m bench.scheduler_bench --users 10000 --tg-latency 0.05 --tg-429-rate 0.01
+
+By default a throwaway SQLite database is used; pass --database to benchmark
+against PostgreSQL (the users table is truncated first).
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+
+from bench.fake_servers import FakeIQAir, FakeTelegram, serve
+
+THRESHOLDS = [101, 151, 201, 301]
+LOCATIONS = {"almaty": 0.8, "astana": 0.15, "shymkent": 0.05}
+
+
+class TimedSession(AiohttpSession):
+    """Records the latency of every sendMessage request"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies: list[float] = []
+
+    async def make_request(self, bot, method, timeout=None):
+        started = time.perf_counter()
+        try:
+            return await super().make_request(bot, method, timeout)
+        finally:
+            if isinstance(method, SendMessage):
+                self.latencies.append(time.perf_counter() - started)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--database", help="SQLAlchemy async URL, defaults to a temp SQLite file")
+    parser.add_argument("--tg-latency", type=float, default=0.05, help="seconds per Bot API call")
+    parser.add_argument("--tg-429-rate", type=float, default=0.0, help="share of 429 answers")
+    parser.add_argument("--tg-retry-after", type=int, default=1)
+    parser.add_argument("--iqair-latency", type=float, default=0.2)
+    parser.add_argument("--alert-aqi", type=int, default=180, help="AQI served during the alert run")
+    parser.add_argument("--rate-limit", type=float, help="override BROADCAST_RATE_LIMIT")
+    parser.add_argument("--workers", type=int, help="override BROADCAST_WORKERS")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def configure_env(args: argparse.Namespace) -> None:
+    """Settings are read on import, so this must run before importing bot modules"""
+    os.environ.setdefault("BOT_TOKEN", "42:bench")
+    os.environ.setdefault("IQAIR_API_KEY", "bench")
+    os.environ.setdefault("POSTGRES_PASSWORD", "bench")
+    # Jobs are measured until the outbox is drained, don't hold messages back
+    os.environ.setdefault("OUTBOX_COALESCE_SECONDS", "0")
+    # nor spread default-time users over the next minutes, the rate limit paces sends
+    os.environ.setdefault("DAILY_SPREAD_SECONDS", "0")
+    os.environ.setdefault("DAILY_FLEXIBLE_SHARE", "1")
+    os.environ["DATABASE_DSN"] = args.database or (
+        f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='almaty_air_bench_')}/bench.db"
+    )
+    if args.rate_limit:
+        os.environ["BROADCAST_RATE_LIMIT"] = str(args.rate_limit)
+    if args.workers:
+        os.environ["BROADCAST_WORKERS"] = str(args.workers)
+
+
+def synthetic_users(count: int, rng: random.Random) -> list[dict]:
+    # Most users keep the default 08:00, the rest are spread around the morning
+    users = []
+    for i in range(count):
+        if rng.random() < 0.6:
+            hour, minute = 8, 0
+        else:
+            hour, minute = rng.randint(6, 10), rng.randrange(0, 60, 5)
+        users.append(
+            {
+                "telegram_id": 10_000_000 + i,
+                "location": rng.choices(list(LOCATIONS), weights=list(LOCATIONS.values()))[0],
+                "daily_enabled": rng.random() < 0.9,
+                "daily_hour": hour,
+                "daily_minute": minute,
+                "daily_time_chosen": (hour, minute) != (8, 0),
+                "alert_enabled": rng.random() < 0.8,
+                "alert_threshold": rng.choice(THRESHOLDS),
+                "last_aqi_level": "good",
+            }
+        )
+    return users
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+async def run(args: argparse.Namespace) -> None:
+    from aiogram import Bot
+    from aiogram.client.telegram import TelegramAPIServer
+    from sqlalchemy import delete, event, insert
+
+    from bot.database import User, async_session, init_db
+    from bot.database.repository import engine
+    from bot.services.iqair import iqair_service
+    from bot.services.outbox import NotificationOutbox
+    from bot.services.schedule_index import schedule_index
+    from bot.services.scheduler import ALMATY_TZ, NotificationScheduler
+
+    queries = 0
+
+    def count_query(*_):
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+
+    telegram = FakeTelegram(args.tg_latency, args.tg_429_rate, args.tg_retry_after)
+    iqair = FakeIQAir(latency=args.iqair_latency)
+    telegram_runner, telegram_url = await serve(telegram.app)
+    iqair_runner, iqair_url = await serve(iqair.app)
+    iqair_service.BASE_URL = f"{iqair_url}/v2"
+
+    session = TimedSession(api=TelegramAPIServer.from_base(telegram_url))
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    outbox = NotificationOutbox(bot)
+    scheduler = NotificationScheduler(bot, outbox)
+
+    print(f"Seeding {args.users} users into {engine.url.render_as_string()}")
+    await init_db()
+    async with async_session() as db:
+        await db.execute(delete(User))
+        rows = synthetic_users(args.users, random.Random(args.seed))
+        for i in range(0, len(rows), 5000):
+            await db.execute(insert(User), rows[i : i + 5000])
+        await db.commit()
+
+    results = []
+
+    async def run_and_deliver(job) -> None:
+        # Jobs only fill the outbox, drain it the same way the workers do,
+        # including messages the delivery planner scheduled for later
+        await job()
+        while True:
+            if await outbox.process_batch():
+                continue
+            if not await outbox.pending():
+                break
+            await asyncio.sleep(0.05)
+
+    async def measure(name: str, job) -> None:
+        nonlocal queries
+        queries = 0
+        session.latencies.clear()
+        sent_before = telegram.sent
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+
+        await run_and_deliver(job)
+
+        elapsed = time.perf_counter() - started
+        sent = telegram.sent - sent_before
+        latencies = session.latencies
+        results.append(
+            {
+                "job": name,
+                "messages": sent,
+                "seconds": elapsed,
+                "throughput": sent / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "peak_mb": tracemalloc.get_traced_memory()[1] / 2**20,
+                "queries": queries,
+            }
+        )
+
+    tracemalloc.start()
+    try:
+        await measure("schedule_index_load", schedule_index.load)
+
+        morning = ALMATY_TZ.localize(datetime(2024, 1, 15, 8, 0))
+        iqair.aqi = 80
+        await measure("daily_notifications", lambda: scheduler._send_daily_notifications(morning))
+
+        # A new measurement is published and the service's fetch plan comes due
+        iqair.publish(args.alert_aqi)
+        iqair_service._next_fetch.clear()
+        await measure("aqi_alerts", scheduler._check_aqi_alerts)
+    finally:
+        tracemalloc.stop()
+        await bot.session.close()
+        await iqair_service.close()
+        await telegram_runner.cleanup()
+        await iqair_runner.cleanup()
+        await engine.dispose()
+
+    header = (
+        f"{'job':<22}{'msgs':>8}{'sec':>9}{'msg/s':>9}"
+        f"{'p50 ms':>9}{'p99 ms':>9}{'peak MB':>9}{'queries':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['job']:<22}{r['messages']:>8}{r['seconds']:>9.2f}{r['throughput']:>9.1f}"
+            f"{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['peak_mb']:>9.1f}{r['queries']:>9}"
+        )
+    print(
+        f"\nBot API: {telegram.sent} sent, {telegram.rejected} rejected with 429; "
+        f"IQAir: {iqair.requests} requests"
+    )
+
+
+def main() -> None:
+    args = parse_args()
+    configure_env(args)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -11,8 +12,34 @@ class Settings(BaseSettings):
     # Telegram Bot
     bot_token: str
 
+    # Webhook mode, polling is used when webhook_url is not set.
+    # Required with several replicas: Telegram lets only one of them poll.
+    webhook_url: str | None = None  # Public base URL, e.g. https://bot.example.com
+    webhook_path: str = "/webhook"
+    webhook_secret: str | None = None
+    web_host: str = "0.0.0.0"
+    web_port: int = 8080
+    update_queue_size: int = 1000
+    update_workers: int = 8
+
+    # Prometheus /metrics endpoint on web_host:web_port
+    metrics_enabled: bool = False
+    # /healthz and /readyz, always served in webhook mode
+    health_enabled: bool = False
+
     # IQAir API
     iqair_api_key: str
+    iqair_pool_size: int = 10
+    iqair_dns_cache_ttl: int = 300  # seconds
+    iqair_keepalive_timeout: float = 60.0
+    iqair_connect_timeout: float = 5.0
+    iqair_read_timeout: float = 10.0
+    iqair_cache_size: int = 32  # locations
+    iqair_update_interval: int = 60  # minutes between upstream measurements
+    iqair_update_lag: int = 5  # minutes to wait after the expected measurement
+    iqair_retry_interval: int = 10  # minutes between polls while the reading is unchanged
+    iqair_daily_budget: int = 500  # API calls, 0 disables the limit
+    iqair_monthly_budget: int = 10000
 
     # PostgreSQL
     postgres_host: str = "postgres"
@@ -21,8 +48,105 @@ class Settings(BaseSettings):
     postgres_password: str
     postgres_db: str = "almaty_air"
 
+    # Overrides the PostgreSQL settings, e.g. sqlite+aiosqlite:///almaty_air.db for local runs
+    database_dsn: str | None = None
+    # Optional read replica for the scheduler's bulk reads, writes always go to the primary
+    database_replica_dsn: str | None = None
+
+    # Connection pool, per engine
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 10.0  # seconds to wait for a free connection
+    db_pool_recycle: int = 1800  # seconds
+    db_statement_cache_size: int = 256  # asyncpg prepared statements per connection
+    db_pool_warmup: int = 4  # connections opened on startup
+
+    # Broadcast (Telegram allows ~30 messages per second)
+    broadcast_workers: int = 16
+    broadcast_rate_limit: float = 25.0  # for the whole bot, split between shard leaders
+    broadcast_chat_interval: float = 1.0
+    broadcast_max_retries: int = 3
+
+    # Notification outbox
+    outbox_workers: int = 2
+    outbox_batch_size: int = 100
+    outbox_poll_interval: float = 1.0  # seconds
+    outbox_lease_seconds: int = 60  # extended while a batch is still sending
+    outbox_max_attempts: int = 5
+    outbox_retry_base_seconds: int = 30
+    outbox_retention_days: int = 3
+    # Notifications wait this long so daily and alert messages to a chat can be merged
+    outbox_coalesce_seconds: float = 15.0
+
+    # Scheduler leader election, replicas with the same shard_index form a failover group
+    shard_count: int = 1  # users are split across shards by telegram_id % shard_count
+    shard_index: int = 0
+    leader_check_interval: float = 10.0  # seconds
+
+    # Daily notification planner, spreads sends of popular minutes
+    daily_strict_window: int = 60  # seconds, for users who picked their own time
+    daily_spread_seconds: int = 600  # users at the default time may wait this long
+    daily_flexible_share: float = 0.7  # of per-second capacity usable by default-time users
+
+    # Daily schedule index, rebuilt from the database every schedule_resync_minutes
+    schedule_resync_minutes: int = 60
+    schedule_sync_seconds: int = 60  # changes made through other replicas, webhook mode only
+
+    # AQI alerts, IQAir is only called when a new measurement is expected
+    alerts_check_minutes: int = 5
+
+    # AQI history
+    history_days: int = 7  # shown by /history
+    history_raw_retention_days: int = 30
+    history_hourly_retention_days: int = 180
+    history_buffer_size: int = 1000  # readings kept in memory if the DB is unavailable
+
+    # Per-user throttling of commands and button presses
+    throttle_rate: float = 1.0  # tokens per second
+    throttle_burst: float = 5.0  # tokens a user can spend at once
+    throttle_cache_size: int = 10000  # users, least recently active are forgotten
+    # Cost per command or callback data, everything else costs 1
+    throttle_costs: dict[str, float] = {"/air": 2.0, "/history": 2.0, "/test": 3.0}
+
+    # Setup wizard, arrow presses less than this many seconds apart become one keyboard edit
+    keyboard_edit_debounce: float = 0.4
+
+    # Update tracing, Zipkin v2 JSON is exported when a URL or file is set
+    trace_slow_threshold: float = 1.0  # seconds, slower updates are logged with their spans
+    trace_sample_rate: float = 0.0  # share of updates exported, slow ones always are
+    trace_export_url: str | None = None  # e.g. http://localhost:9411/api/v2/spans
+    trace_export_file: str | None = None  # one JSON batch per line
+    trace_export_interval: float = 5.0  # seconds
+    trace_export_buffer: int = 10000  # spans
+
+    # Admin diagnostics, /profile only answers these Telegram ids
+    admin_ids: list[int] = []
+    profile_dir: str = "profiles"  # CPU profiles, memory diffs and task stacks
+    tracemalloc_frames: int = 10
+    loop_monitor_interval: float = 0.5  # seconds
+    loop_stall_threshold: float = 1.0  # seconds without a loop tick before dumping its stack
+
+    # User settings cache for handlers
+    user_cache_ttl: float = 300.0  # seconds before re-reading changes made by other instances
+    user_cache_size: int = 10000
+
+    # FSM storage write-behind cache
+    fsm_flush_interval: float = 1.0  # seconds
+    fsm_cache_ttl: float = 10.0  # seconds before re-reading state written by other instances
+    fsm_cache_size: int = 10000
+
+    @model_validator(mode="after")
+    def check_sharding(self) -> "Settings":
+        if not 0 <= self.shard_index < self.shard_count:
+            raise ValueError(f"SHARD_INDEX must be in [0, {self.shard_count})")
+        if self.shard_count > 1 and not self.webhook_url:
+            raise ValueError("SHARD_COUNT > 1 needs WEBHOOK_URL, polling replicas conflict")
+        return self
+
     @property
     def database_url(self) -> str:
+        if self.database_dsn:
+            return self.database_dsn
         return (
             f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}"
             f"@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
@@ -1,4 +1,47 @@
-from .models import Base, User
-from .repository import UserRepository, get_session, init_db, async_session
+from .models import (
+    ApiUsage,
+    AqiDaily,
+    AqiHourly,
+    AqiReading,
+    Base,
+    FsmRecord,
+    OutboxMessage,
+    User,
+)
+from .repository import (
+    ApiUsageRepository,
+    AqiHistoryRepository,
+    OutboxRepository,
+    UserRepository,
+    async_read_session,
+    async_session,
+    check_schema,
+    dispose_engines,
+    get_session,
+    init_db,
+    warm_up_pool,
+)
+from .storage import DatabaseStorage
 
-__all__ = ["Base", "User", "UserRepository", "get_session", "init_db", "async_session"]
+__all__ = [
+    "ApiUsage",
+    "AqiDaily",
+    "AqiHourly",
+    "AqiReading",
+    "Base",
+    "FsmRecord",
+    "OutboxMessage",
+    "User",
+    "ApiUsageRepository",
+    "AqiHistoryRepository",
+    "OutboxRepository",
+    "UserRepository",
+    "get_session",
+    "init_db",
+    "check_schema",
+    "dispose_engines",
+    "warm_up_pool",
+    "async_session",
+    "async_read_session",
+    "DatabaseStorage",
+]
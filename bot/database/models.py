@@ -1,6 +1,18 @@
 from datetime import datetime
 
-from sqlalchemy import BigInteger, Boolean, DateTime, Integer, String, func
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    Text,
+    false,
+    func,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -10,14 +22,50 @@ class Base(DeclarativeBase):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Daily notification lookup by time, only for subscribed users
+        Index(
+            "ix_users_daily_schedule",
+            "daily_hour",
+            "daily_minute",
+            postgresql_where=text("daily_enabled"),
+            sqlite_where=text("daily_enabled"),
+        ),
+        # Alert recipients of a location by threshold, and level sync / improvements by level
+        Index(
+            "ix_users_alert_threshold",
+            "location",
+            "alert_threshold",
+            "last_aqi_level",
+            postgresql_where=text("alert_enabled"),
+            sqlite_where=text("alert_enabled"),
+        ),
+        Index(
+            "ix_users_alert_level",
+            "location",
+            "last_aqi_level",
+            postgresql_where=text("alert_enabled"),
+            sqlite_where=text("alert_enabled"),
+        ),
+        # Settings changed since the last schedule sync
+        Index("ix_users_updated_at", "updated_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, nullable=False, index=True)
 
+    # IQAir location key, see bot.services.locations
+    location: Mapped[str] = mapped_column(String(32), default="almaty", server_default="almaty")
+
     # Daily notifications settings
     daily_enabled: Mapped[bool] = mapped_column(Boolean, default=True)
     daily_hour: Mapped[int] = mapped_column(Integer, default=8)
     daily_minute: Mapped[int] = mapped_column(Integer, default=0)
+    # Picked by the user rather than kept at the default. Others don't mind waiting
+    # a few minutes, the delivery planner spreads their notifications out.
+    daily_time_chosen: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default=false()
+    )
 
     # Alert notifications settings
     alert_enabled: Mapped[bool] = mapped_column(Boolean, default=True)
@@ -30,9 +78,109 @@ class User(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
+    # Settings changes, the schedule sync reads it. Alert level writes keep it.
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
     def __repr__(self) -> str:
         return f"<User(telegram_id={self.telegram_id})>"
+
+
+class AqiReading(Base):
+    __tablename__ = "aqi_readings"
+    __table_args__ = (
+        # One reading per measurement, replicas and retries may store it again
+        Index("ix_aqi_readings_location_measured_at", "location", "measured_at", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    location: Mapped[str] = mapped_column(String(32), nullable=False)
+    aqi: Mapped[int] = mapped_column(Integer, nullable=False)
+    main_pollutant: Mapped[str] = mapped_column(String(8), nullable=False)
+    measured_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<AqiReading(location={self.location}, aqi={self.aqi})>"
+
+
+class AqiRollupMixin:
+    """Aggregated readings per location and time bucket"""
+
+    location: Mapped[str] = mapped_column(String(32), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    samples: Mapped[int] = mapped_column(Integer, nullable=False)
+    aqi_sum: Mapped[int] = mapped_column(Integer, nullable=False)
+    aqi_min: Mapped[int] = mapped_column(Integer, nullable=False)
+    aqi_max: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    @property
+    def aqi_avg(self) -> int:
+        return round(self.aqi_sum / self.samples)
+
+
+class AqiHourly(AqiRollupMixin, Base):
+    __tablename__ = "aqi_hourly"
+
+
+class AqiDaily(AqiRollupMixin, Base):
+    __tablename__ = "aqi_daily"
+
+
+class ApiUsage(Base):
+    """Calls made to an external API per accounting period, see bot.services.quota"""
+
+    __tablename__ = "api_usage"
+
+    api: Mapped[str] = mapped_column(String(32), primary_key=True)
+    period: Mapped[str] = mapped_column(String(16), primary_key=True)  # 2024-01-15 or 2024-01
+    calls: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class FsmRecord(Base):
+    """aiogram FSM state and data, see bot.database.storage"""
+
+    __tablename__ = "fsm_storage"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class OutboxMessage(Base):
+    """Notification waiting for delivery, claimed by workers with SKIP LOCKED"""
+
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        Index(
+            "ix_notification_outbox_pending",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True
+    )
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+
+    # pending -> sent | failed | merged; claimed rows stay pending with next_attempt_at
+    # pushed forward, so a crashed worker's batch is picked up again later
+    status: Mapped[str] = mapped_column(String(16), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_error: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<OutboxMessage(id={self.id}, chat_id={self.chat_id}, status={self.status})>"
@@ -1,21 +1,148 @@
-from collections.abc import AsyncGenerator
+import asyncio
+from collections import defaultdict
+from collections.abc import AsyncGenerator, Iterable, Mapping, Sequence
+from datetime import datetime, time, timedelta, timezone
+from pathlib import Path
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import pytz
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import (
+    Insert,
+    and_,
+    case,
+    delete,
+    distinct,
+    func,
+    insert,
+    or_,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 
 from bot.config import settings
 
-from .models import Base, User
+from .models import (
+    ApiUsage,
+    AqiDaily,
+    AqiHourly,
+    AqiReading,
+    AqiRollupMixin,
+    Base,
+    OutboxMessage,
+    User,
+)
 
-engine = create_async_engine(settings.database_url, echo=False)
+ALMATY_TZ = pytz.timezone("Asia/Almaty")
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+
+
+def make_engine(url: str) -> AsyncEngine:
+    kwargs = {}
+    if make_url(url).get_backend_name() == "postgresql":
+        kwargs["connect_args"] = {
+            "prepared_statement_cache_size": settings.db_statement_cache_size
+        }
+    return create_async_engine(
+        url,
+        echo=False,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        **kwargs,
+    )
+
+
+engine = make_engine(settings.database_url)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Bulk reads of the scheduler, served by the replica when one is configured
+read_engine = (
+    make_engine(settings.database_replica_dsn) if settings.database_replica_dsn else engine
+)
+async_read_session = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# Bound parameters per IN list, asyncpg allows 32767 per statement
+IN_CHUNK_SIZE = 10000
+
+
+def in_shard(column):
+    """Restrict a query to users owned by this replica's shard"""
+    if settings.shard_count == 1:
+        return true()
+    return column % settings.shard_count == settings.shard_index
+
+
+def upsert(model) -> Insert:
+    """INSERT supporting on_conflict_do_update for the configured database"""
+    if engine.dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
+
+
+def least(*args):
+    return func.min(*args) if engine.dialect.name == "sqlite" else func.least(*args)
+
+
+def greatest(*args):
+    return func.max(*args) if engine.dialect.name == "sqlite" else func.greatest(*args)
+
 
 async def init_db() -> None:
+    """Create tables directly, only for throwaway databases such as benchmarks"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def check_schema() -> str:
+    """Make sure the database is migrated to the latest Alembic revision"""
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(ALEMBIC_INI.parent / "alembic"))
+    head = ScriptDirectory.from_config(config).get_current_head()
+
+    async with engine.connect() as conn:
+        current = await conn.run_sync(
+            lambda sync_conn: MigrationContext.configure(sync_conn).get_current_revision()
+        )
+
+    if current != head:
+        raise RuntimeError(
+            f"Database schema is at revision {current}, expected {head}. "
+            "Run `alembic upgrade head` first"
+        )
+    return current
+
+
+async def warm_up_pool(connections: int) -> None:
+    """Open pool connections up front so first requests skip the handshake"""
+
+    async def ping() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(select(1))
+
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+
+async def dispose_engines() -> None:
+    """Close pooled connections, aiosqlite's worker threads keep the process alive otherwise"""
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session() as session:
         yield session
@@ -52,24 +179,382 @@ class UserRepository:
         await self.session.refresh(user)
         return user
 
-    async def get_users_for_daily_notification(self, hour: int, minute: int) -> list[User]:
+    async def save(self, telegram_id: int, **values) -> User:
+        """Create or update a user in one statement, returning the stored row"""
+        stmt = upsert(User).values(telegram_id=telegram_id, **values)
+        # An empty update still returns the existing row
+        set_ = {**values, "updated_at": func.now()} if values else {
+            "telegram_id": stmt.excluded.telegram_id
+        }
+        stmt = stmt.on_conflict_do_update(index_elements=[User.telegram_id], set_=set_)
+        result = await self.session.execute(
+            stmt.returning(User), execution_options={"populate_existing": True}
+        )
+        user = result.scalar_one()
+        await self.session.commit()
+        return user
+
+    async def get_daily_schedule(self) -> list[tuple[int, int, int, str, bool]]:
+        """Return (telegram_id, hour, minute, location, time_chosen) for every daily subscriber"""
         result = await self.session.execute(
-            select(User).where(
-                User.daily_enabled == True,
-                User.daily_hour == hour,
-                User.daily_minute == minute,
+            select(
+                User.telegram_id,
+                User.daily_hour,
+                User.daily_minute,
+                User.location,
+                User.daily_time_chosen,
+            ).where(User.daily_enabled == True, in_shard(User.telegram_id))
+        )
+        return [tuple(row) for row in result.all()]
+
+    async def get_schedule_changes(
+        self, since: datetime
+    ) -> list[tuple[int, bool, int, int, str, bool, datetime]]:
+        """Return the schedule settings of users changed after since
+
+        Rows are (telegram_id, enabled, hour, minute, location, time_chosen, updated_at).
+        """
+        result = await self.session.execute(
+            select(
+                User.telegram_id,
+                User.daily_enabled,
+                User.daily_hour,
+                User.daily_minute,
+                User.location,
+                User.daily_time_chosen,
+                User.updated_at,
+            ).where(User.updated_at > since, in_shard(User.telegram_id))
+        )
+        return [tuple(row) for row in result.all()]
+
+    async def get_last_update(self) -> datetime | None:
+        result = await self.session.execute(
+            select(func.max(User.updated_at)).where(in_shard(User.telegram_id))
+        )
+        return result.scalar_one()
+
+    async def get_alert_locations(self) -> list[str]:
+        result = await self.session.execute(
+            select(distinct(User.location)).where(
+                User.alert_enabled == True, in_shard(User.telegram_id)
             )
         )
         return list(result.scalars().all())
 
-    async def get_users_for_alert(self) -> list[User]:
+    async def get_subscribed_locations(self) -> list[str]:
+        """Locations with daily or alert subscribers in any shard"""
         result = await self.session.execute(
-            select(User).where(User.alert_enabled == True)
+            select(distinct(User.location)).where(
+                or_(User.daily_enabled == True, User.alert_enabled == True)
+            )
         )
         return list(result.scalars().all())
 
-    async def update_last_aqi_level(self, telegram_id: int, level: str) -> None:
-        user = await self.get_by_telegram_id(telegram_id)
-        if user:
-            user.last_aqi_level = level
-            await self.session.commit()
+    async def get_alert_recipients(
+        self, location: str, aqi: int, levels: Sequence[tuple[int, str]]
+    ) -> list[tuple[int, int, str | None]]:
+        """Return (telegram_id, alert_threshold, last_aqi_level) of users due an alert
+
+        levels are the (lower bound, level) pairs from the highest down. A user
+        is due an alert when the AQI and their last level lie on different sides
+        of their threshold. Mirrors bot.services.alerts.decide_alert. The rows
+        stay locked until the caller commits their new level.
+        """
+        ranks = {level: rank for rank, (_, level) in enumerate(reversed(levels), start=1)}
+        last_rank = case(ranks, value=User.last_aqi_level, else_=0)
+        threshold_rank = case(
+            *((User.alert_threshold >= bound, ranks[level]) for bound, level in levels),
+            else_=0,
+        )
+        result = await self.session.execute(
+            select(User.telegram_id, User.alert_threshold, User.last_aqi_level).where(
+                User.alert_enabled == True,
+                User.location == location,
+                or_(
+                    and_(User.alert_threshold <= aqi, last_rank < threshold_rank),
+                    and_(User.alert_threshold > aqi, last_rank >= threshold_rank),
+                ),
+                in_shard(User.telegram_id),
+            )
+            .with_for_update()
+        )
+        return [tuple(row) for row in result.all()]
+
+    async def set_last_aqi_level(self, telegram_ids: Sequence[int], level: str) -> int:
+        """Move the given users to the current level, the caller commits
+
+        Only users who get an alert change sides of their threshold, the others
+        keep a level on the same side and need no write. updated_at is left as
+        it is, it tracks settings changes for the schedule sync.
+        """
+        updated = 0
+        for i in range(0, len(telegram_ids), IN_CHUNK_SIZE):
+            result = await self.session.execute(
+                update(User)
+                .where(User.telegram_id.in_(telegram_ids[i : i + IN_CHUNK_SIZE]))
+                .values(last_aqi_level=level, updated_at=User.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+            updated += result.rowcount
+        return updated
+
+
+class AqiHistoryRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add_readings(self, readings: Iterable[AqiReading]) -> int:
+        """Insert new raw readings and fold them into hourly and daily rollups
+
+        A reading already stored, e.g. retried after a lost commit or fetched by
+        another replica, is skipped and not counted twice.
+        """
+        rows = [
+            {
+                "location": r.location,
+                "aqi": r.aqi,
+                "main_pollutant": r.main_pollutant,
+                "measured_at": r.measured_at,
+            }
+            for r in readings
+        ]
+        if not rows:
+            return 0
+
+        result = await self.session.execute(
+            upsert(AqiReading)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[AqiReading.location, AqiReading.measured_at])
+            .returning(AqiReading.location, AqiReading.aqi, AqiReading.measured_at)
+        )
+        inserted = result.all()
+
+        hourly: dict[tuple[str, datetime], list[int]] = defaultdict(list)
+        daily: dict[tuple[str, datetime], list[int]] = defaultdict(list)
+        for location, aqi, measured_at in inserted:
+            measured_at = as_utc(measured_at)
+            hourly[(location, hour_bucket(measured_at))].append(aqi)
+            daily[(location, day_bucket(measured_at))].append(aqi)
+
+        if inserted:
+            await self._upsert_rollups(AqiHourly, hourly)
+            await self._upsert_rollups(AqiDaily, daily)
+        await self.session.commit()
+        return len(inserted)
+
+    async def _upsert_rollups(
+        self, model: type[AqiRollupMixin], buckets: dict[tuple[str, datetime], list[int]]
+    ) -> None:
+        stmt = upsert(model).values(
+            [
+                {
+                    "location": location,
+                    "bucket": bucket,
+                    "samples": len(values),
+                    "aqi_sum": sum(values),
+                    "aqi_min": min(values),
+                    "aqi_max": max(values),
+                }
+                for (location, bucket), values in buckets.items()
+            ]
+        )
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[model.location, model.bucket],
+                set_={
+                    "samples": model.samples + stmt.excluded.samples,
+                    "aqi_sum": model.aqi_sum + stmt.excluded.aqi_sum,
+                    "aqi_min": least(model.aqi_min, stmt.excluded.aqi_min),
+                    "aqi_max": greatest(model.aqi_max, stmt.excluded.aqi_max),
+                },
+            )
+        )
+
+    async def get_hourly(self, location: str, since: datetime) -> list[AqiHourly]:
+        return await self._get_rollups(AqiHourly, location, since)
+
+    async def get_daily(self, location: str, since: datetime) -> list[AqiDaily]:
+        return await self._get_rollups(AqiDaily, location, since)
+
+    async def _get_rollups(self, model, location: str, since: datetime) -> list:
+        result = await self.session.execute(
+            select(model)
+            .where(model.location == location, model.bucket >= since)
+            .order_by(model.bucket)
+        )
+        return list(result.scalars().all())
+
+    async def delete_readings_before(self, cutoff: datetime) -> int:
+        result = await self.session.execute(
+            delete(AqiReading).where(AqiReading.measured_at < cutoff)
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def delete_hourly_before(self, cutoff: datetime) -> int:
+        result = await self.session.execute(delete(AqiHourly).where(AqiHourly.bucket < cutoff))
+        await self.session.commit()
+        return result.rowcount
+
+
+class OutboxRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def enqueue(self, rows: list[dict]) -> int:
+        """Insert outbox rows (chat_id, kind, text, next_attempt_at), the caller commits"""
+        if not rows:
+            return 0
+        await self.session.execute(insert(OutboxMessage), rows)
+        return len(rows)
+
+    async def claim(
+        self, limit: int, lease: timedelta, coalesce_kinds: Iterable[str] = ()
+    ) -> list[OutboxMessage]:
+        """Lock a batch of due messages and hide them from other workers for the lease
+
+        Fresh (never attempted) messages of coalesce_kinds for the same chats are
+        claimed along with them even if not due yet, so they can be merged.
+        """
+        now = datetime.now(timezone.utc)
+        result = await self.session.execute(
+            select(OutboxMessage)
+            .where(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now)
+            .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        messages = list(result.scalars().all())
+
+        coalesce_kinds = list(coalesce_kinds)
+        chat_ids = list({m.chat_id for m in messages if m.kind in coalesce_kinds})
+        if chat_ids:
+            result = await self.session.execute(
+                select(OutboxMessage)
+                .where(
+                    OutboxMessage.status == "pending",
+                    OutboxMessage.attempts == 0,
+                    OutboxMessage.chat_id.in_(chat_ids),
+                    OutboxMessage.kind.in_(coalesce_kinds),
+                    OutboxMessage.id.not_in([m.id for m in messages]),
+                )
+                .with_for_update(skip_locked=True)
+            )
+            messages.extend(result.scalars().all())
+
+        if messages:
+            await self.session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_([m.id for m in messages]))
+                .values(next_attempt_at=now + lease, attempts=OutboxMessage.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+        await self.session.commit()
+        return messages
+
+    async def count_pending(self) -> int:
+        result = await self.session.execute(
+            select(func.count()).where(OutboxMessage.status == "pending")
+        )
+        return result.scalar_one()
+
+    async def mark_sent(self, ids: list[int]) -> None:
+        if not ids:
+            return
+        await self.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(ids))
+            .values(status="sent", sent_at=datetime.now(timezone.utc), last_error=None)
+        )
+        await self.session.commit()
+
+    async def mark_merged(self, ids: list[int]) -> None:
+        """Finish messages superseded by another message to the same chat"""
+        if not ids:
+            return
+        await self.session.execute(
+            update(OutboxMessage).where(OutboxMessage.id.in_(ids)).values(status="merged")
+        )
+        await self.session.commit()
+
+    async def mark_failed(self, ids: list[int], error: str) -> None:
+        if not ids:
+            return
+        await self.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(ids))
+            .values(status="failed", last_error=error[:255])
+        )
+        await self.session.commit()
+
+    async def reschedule(self, ids: list[int], at: datetime, error: str) -> None:
+        if not ids:
+            return
+        await self.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(ids))
+            .values(next_attempt_at=at, last_error=error[:255])
+        )
+        await self.session.commit()
+
+    async def extend_lease(self, ids: list[int], until: datetime) -> None:
+        if not ids:
+            return
+        await self.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(ids), OutboxMessage.status == "pending")
+            .values(next_attempt_at=until)
+        )
+        await self.session.commit()
+
+    async def delete_finished_before(self, cutoff: datetime) -> int:
+        result = await self.session.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.status != "pending", OutboxMessage.created_at < cutoff
+            )
+        )
+        await self.session.commit()
+        return result.rowcount
+
+
+def as_utc(moment: datetime) -> datetime:
+    """SQLite returns stored UTC timestamps without a timezone"""
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment: datetime) -> datetime:
+    """Start of the local (Almaty) day containing the moment"""
+    local_date = moment.astimezone(ALMATY_TZ).date()
+    return ALMATY_TZ.localize(datetime.combine(local_date, time()))
+
+
+class ApiUsageRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def spend(self, api: str, limits: Mapping[str, int]) -> dict[str, int] | None:
+        """Count one call in every period, or nothing if any limit would be exceeded
+
+        Returns the new per-period totals. A limit of 0 means unlimited.
+        """
+        used: dict[str, int] = {}
+        for period, limit in limits.items():
+            stmt = upsert(ApiUsage).values(api=api, period=period, calls=1)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ApiUsage.api, ApiUsage.period],
+                set_={"calls": ApiUsage.calls + 1},
+            ).returning(ApiUsage.calls)
+            used[period] = (await self.session.execute(stmt)).scalar_one()
+
+            if limit and used[period] > limit:
+                await self.session.rollback()
+                return None
+
+        await self.session.commit()
+        return used
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from sqlalchemy import delete, select
+
+from bot.config import settings
+from bot.tracing import detached_task, span
+
+from .models import FsmRecord
+from .repository import async_session, upsert
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.monotonic)
+    version: int = 0
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM storage persisted in the database behind an in-process write-behind cache
+
+    Reads are served from memory while an entry is fresh. Writes only mark the
+    entry dirty; a background flush coalesces all changes made within
+    ``fsm_flush_interval`` into one round-trip.
+    """
+
+    def __init__(self, key_builder: KeyBuilder | None = None):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flush_task: asyncio.Task | None = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry_key = self.key_builder.build(key)
+        entry = await self._get_entry(entry_key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(entry_key, entry)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        entry = await self._get_entry(self.key_builder.build(key))
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        entry_key = self.key_builder.build(key)
+        entry = await self._get_entry(entry_key)
+        entry.data = data.copy()
+        self._mark_dirty(entry_key, entry)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        entry = await self._get_entry(self.key_builder.build(key))
+        return entry.data.copy()
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write all dirty entries to the database"""
+        if not self._dirty:
+            return
+
+        snapshot = {key: (self._cache[key], self._cache[key].version) for key in self._dirty}
+        upserts = [
+            {"key": key, "state": entry.state, "data": entry.data}
+            for key, (entry, _) in snapshot.items()
+            if entry.state is not None or entry.data
+        ]
+        # Finished wizards leave an empty record behind, drop it instead
+        deletes = [
+            key
+            for key, (entry, _) in snapshot.items()
+            if entry.state is None and not entry.data
+        ]
+
+        async with async_session() as session:
+            if upserts:
+                stmt = upsert(FsmRecord).values(upserts)
+                await session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[FsmRecord.key],
+                        set_={"state": stmt.excluded.state, "data": stmt.excluded.data},
+                    )
+                )
+            if deletes:
+                await session.execute(delete(FsmRecord).where(FsmRecord.key.in_(deletes)))
+            await session.commit()
+
+        # Entries changed while flushing stay dirty for the next round
+        for key, (entry, version) in snapshot.items():
+            if entry.version == version:
+                self._dirty.discard(key)
+
+        self._evict()
+
+    async def _get_entry(self, entry_key: str) -> _Entry:
+        entry = self._cache.get(entry_key)
+        if entry is not None and (
+            entry_key in self._dirty
+            or time.monotonic() - entry.loaded_at < settings.fsm_cache_ttl
+        ):
+            self._cache.move_to_end(entry_key)
+            return entry
+
+        with span("db fsm.load"):
+            async with async_session() as session:
+                result = await session.execute(
+                    select(FsmRecord).where(FsmRecord.key == entry_key)
+                )
+                record = result.scalar_one_or_none()
+
+        # Reuse the cached object so concurrent holders see the refreshed values,
+        # and never overwrite changes made while the query was running
+        entry = self._cache.get(entry_key) or _Entry()
+        if entry_key not in self._dirty:
+            entry.state = record.state if record else None
+            entry.data = dict(record.data) if record else {}
+        entry.loaded_at = time.monotonic()
+
+        self._cache[entry_key] = entry
+        self._cache.move_to_end(entry_key)
+        self._evict()
+        return entry
+
+    def _mark_dirty(self, entry_key: str, entry: _Entry) -> None:
+        entry.version += 1
+        entry.loaded_at = time.monotonic()
+        self._dirty.add(entry_key)
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = detached_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(settings.fsm_flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush FSM storage: {e}")
+
+        # Writes that arrived during the flush get their own round
+        if self._dirty:
+            self._flush_task = detached_task(self._flush_later())
+
+    def _evict(self) -> None:
+        # Dirty entries are kept until flushed
+        excess = len(self._cache) - settings.fsm_cache_size
+        for entry_key in list(self._cache):
+            if excess <= 0:
+                break
+            if entry_key not in self._dirty:
+                del self._cache[entry_key]
+                excess -= 1
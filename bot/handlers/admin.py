@@ -0,0 +1,64 @@
+import html
+from pathlib import Path
+
+from aiogram import F, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from bot.config import settings
+from bot.services.profiler import profiler
+
+router = Router()
+router.message.filter(F.from_user.id.in_(settings.admin_ids))
+
+PROFILE_HELP = """<b>Профилирование</b>
+/profile start — начать профилирование CPU
+/profile stop — остановить и сохранить профиль
+/profile memory — разница выделений памяти с прошлым снимком
+/profile memory_stop — выключить tracemalloc
+/profile tasks — стеки всех задач asyncio"""
+
+# Telegram limits messages to 4096 characters
+MAX_SUMMARY = 3500
+
+
+def format_result(path: Path, summary: str) -> str:
+    if len(summary) > MAX_SUMMARY:
+        summary = summary[:MAX_SUMMARY] + "\n…"
+    return (
+        f"Сохранено в <code>{html.escape(str(path))}</code>\n"
+        f"<pre>{html.escape(summary)}</pre>"
+    )
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, command: CommandObject) -> None:
+    """Profile the running bot, admins only"""
+    action = (command.args or "").strip()
+
+    if action == "start":
+        if profiler.start_cpu():
+            await message.answer("Профилирование CPU запущено. Остановить: /profile stop")
+        else:
+            await message.answer("Профилирование CPU уже запущено.")
+    elif action == "stop":
+        result = profiler.stop_cpu()
+        if result:
+            await message.answer(format_result(*result))
+        else:
+            await message.answer("Профилирование CPU не запущено.")
+    elif action == "memory":
+        await message.answer(format_result(*profiler.memory_diff()))
+    elif action == "memory_stop":
+        profiler.stop_memory()
+        await message.answer("tracemalloc выключен.")
+    elif action == "tasks":
+        await message.answer(format_result(*profiler.task_stacks()))
+    else:
+        monitor = profiler.monitor
+        await message.answer(
+            f"{PROFILE_HELP}\n\n"
+            f"Задержка цикла событий: {monitor.lag * 1000:.1f} мс, "
+            f"максимум {monitor.max_lag * 1000:.1f} мс\n"
+            f"CPU профиль: {'запущен' if profiler.cpu_running else 'не запущен'}"
+        )
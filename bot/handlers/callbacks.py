@@ -2,13 +2,18 @@ from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
 
-from bot.database import UserRepository, async_session
 from bot.keyboards import (
+    ALERT_THRESHOLDS,
     get_notification_choices_keyboard,
     get_threshold_keyboard,
     get_time_keyboard,
 )
+from bot.services.alerts import alert_level
 from bot.services.iqair import iqair_service
+from bot.services.keyboard_edits import keyboard_edits
+from bot.services.locations import LOCATIONS, get_location
+from bot.services.schedule_index import schedule_index
+from bot.services.user_settings import user_settings
 from bot.states import SetupStates
 
 router = Router()
@@ -23,11 +28,12 @@ async def toggle_daily(callback: CallbackQuery, state: FSMContext) -> None:
     daily_enabled = not data.get("daily_enabled", True)
     await state.update_data(daily_enabled=daily_enabled)
 
-    await callback.message.edit_reply_markup(
-        reply_markup=get_notification_choices_keyboard(
+    keyboard_edits.edit(
+        callback.message,
+        get_notification_choices_keyboard(
             daily_enabled=daily_enabled,
             alert_enabled=data.get("alert_enabled", True),
-        )
+        ),
     )
     await callback.answer()
 
@@ -38,11 +44,12 @@ async def toggle_alert(callback: CallbackQuery, state: FSMContext) -> None:
     alert_enabled = not data.get("alert_enabled", True)
     await state.update_data(alert_enabled=alert_enabled)
 
-    await callback.message.edit_reply_markup(
-        reply_markup=get_notification_choices_keyboard(
+    keyboard_edits.edit(
+        callback.message,
+        get_notification_choices_keyboard(
             daily_enabled=data.get("daily_enabled", True),
             alert_enabled=alert_enabled,
-        )
+        ),
     )
     await callback.answer()
 
@@ -53,6 +60,7 @@ async def notifications_done(callback: CallbackQuery, state: FSMContext) -> None
     daily_enabled = data.get("daily_enabled", True)
     alert_enabled = data.get("alert_enabled", True)
 
+    keyboard_edits.cancel(callback.message)
     if daily_enabled:
         # Go to time selection screen
         await state.set_state(SetupStates.set_time)
@@ -85,10 +93,11 @@ async def notifications_done(callback: CallbackQuery, state: FSMContext) -> None
 async def hour_increment(callback: CallbackQuery, state: FSMContext) -> None:
     data = await state.get_data()
     hour = (data.get("daily_hour", 8) + 1) % 24
-    await state.update_data(daily_hour=hour)
+    await state.update_data(daily_hour=hour, daily_time_chosen=True)
 
-    await callback.message.edit_reply_markup(
-        reply_markup=get_time_keyboard(hour=hour, minute=data.get("daily_minute", 0))
+    keyboard_edits.edit(
+        callback.message,
+        get_time_keyboard(hour=hour, minute=data.get("daily_minute", 0)),
     )
     await callback.answer()
 
@@ -97,10 +106,11 @@ async def hour_increment(callback: CallbackQuery, state: FSMContext) -> None:
 async def hour_decrement(callback: CallbackQuery, state: FSMContext) -> None:
     data = await state.get_data()
     hour = (data.get("daily_hour", 8) - 1) % 24
-    await state.update_data(daily_hour=hour)
+    await state.update_data(daily_hour=hour, daily_time_chosen=True)
 
-    await callback.message.edit_reply_markup(
-        reply_markup=get_time_keyboard(hour=hour, minute=data.get("daily_minute", 0))
+    keyboard_edits.edit(
+        callback.message,
+        get_time_keyboard(hour=hour, minute=data.get("daily_minute", 0)),
     )
     await callback.answer()
 
@@ -109,10 +119,11 @@ async def hour_decrement(callback: CallbackQuery, state: FSMContext) -> None:
 async def minute_increment(callback: CallbackQuery, state: FSMContext) -> None:
     data = await state.get_data()
     minute = (data.get("daily_minute", 0) + 5) % 60  # Increment by 5 minutes
-    await state.update_data(daily_minute=minute)
+    await state.update_data(daily_minute=minute, daily_time_chosen=True)
 
-    await callback.message.edit_reply_markup(
-        reply_markup=get_time_keyboard(hour=data.get("daily_hour", 8), minute=minute)
+    keyboard_edits.edit(
+        callback.message,
+        get_time_keyboard(hour=data.get("daily_hour", 8), minute=minute),
     )
     await callback.answer()
 
@@ -121,10 +132,11 @@ async def minute_increment(callback: CallbackQuery, state: FSMContext) -> None:
 async def minute_decrement(callback: CallbackQuery, state: FSMContext) -> None:
     data = await state.get_data()
     minute = (data.get("daily_minute", 0) - 5) % 60  # Decrement by 5 minutes
-    await state.update_data(daily_minute=minute)
+    await state.update_data(daily_minute=minute, daily_time_chosen=True)
 
-    await callback.message.edit_reply_markup(
-        reply_markup=get_time_keyboard(hour=data.get("daily_hour", 8), minute=minute)
+    keyboard_edits.edit(
+        callback.message,
+        get_time_keyboard(hour=data.get("daily_hour", 8), minute=minute),
     )
     await callback.answer()
 
@@ -139,6 +151,7 @@ async def time_done(callback: CallbackQuery, state: FSMContext) -> None:
     data = await state.get_data()
     alert_enabled = data.get("alert_enabled", True)
 
+    keyboard_edits.cancel(callback.message)
     if alert_enabled:
         # Go to threshold selection
         await state.set_state(SetupStates.set_threshold)
@@ -166,12 +179,54 @@ async def select_threshold(callback: CallbackQuery, state: FSMContext) -> None:
         await callback.answer()
         return
 
-    # Extract threshold value
-    threshold = int(data_value.replace("threshold_", ""))
+    # Only the offered thresholds, callback data can be forged
+    threshold = next(
+        (value for value, _ in ALERT_THRESHOLDS if data_value == f"threshold_{value}"), None
+    )
+    if threshold is None:
+        await callback.answer()
+        return
+
     await state.update_data(alert_threshold=threshold)
 
-    await callback.message.edit_reply_markup(
-        reply_markup=get_threshold_keyboard(selected_threshold=threshold)
+    keyboard_edits.edit(
+        callback.message,
+        get_threshold_keyboard(selected_threshold=threshold),
+    )
+    await callback.answer()
+
+
+# ============ Location selection ============
+
+
+@router.callback_query(F.data.startswith("location_"))
+async def select_location(callback: CallbackQuery) -> None:
+    location = callback.data.replace("location_", "")
+    if location not in LOCATIONS:
+        await callback.answer()
+        return
+
+    # Reset last AQI level to the new city to avoid a false alert
+    air_data = await iqair_service.get_air_quality(location)
+
+    user = await user_settings.save(
+        callback.from_user.id,
+        location=location,
+        last_aqi_level=alert_level(air_data.aqi) if air_data else None,
+    )
+
+    schedule_index.update(
+        user.telegram_id,
+        enabled=user.daily_enabled,
+        hour=user.daily_hour,
+        minute=user.daily_minute,
+        location=user.location,
+        time_chosen=user.daily_time_chosen,
+    )
+
+    await callback.message.edit_text(
+        f"✅ Город выбран: <b>{LOCATIONS[location].name}</b>",
+        parse_mode="HTML",
     )
     await callback.answer()
 
@@ -187,22 +242,29 @@ async def save_settings_and_finish(callback: CallbackQuery, state: FSMContext) -
     # This prevents false alerts on first scheduler check
     current_level = None
     if data.get("alert_enabled", True):
-        air_data = await iqair_service.get_air_quality()
+        air_data = await iqair_service.get_air_quality(get_location(data.get("location")).key)
         if air_data:
-            current_level = air_data.level
+            current_level = alert_level(air_data.aqi)
+
+    user = await user_settings.save(
+        callback.from_user.id,
+        daily_enabled=data.get("daily_enabled", True),
+        daily_hour=data.get("daily_hour", 8),
+        daily_minute=data.get("daily_minute", 0),
+        daily_time_chosen=data.get("daily_time_chosen", False),
+        alert_enabled=data.get("alert_enabled", True),
+        alert_threshold=data.get("alert_threshold", 101),
+        last_aqi_level=current_level,
+    )
 
-    async with async_session() as session:
-        repo = UserRepository(session)
-        user = await repo.get_or_create(callback.from_user.id)
-        await repo.update(
-            user,
-            daily_enabled=data.get("daily_enabled", True),
-            daily_hour=data.get("daily_hour", 8),
-            daily_minute=data.get("daily_minute", 0),
-            alert_enabled=data.get("alert_enabled", True),
-            alert_threshold=data.get("alert_threshold", 101),
-            last_aqi_level=current_level,
-        )
+    schedule_index.update(
+        callback.from_user.id,
+        enabled=user.daily_enabled,
+        hour=user.daily_hour,
+        minute=user.daily_minute,
+        location=user.location,
+        time_chosen=user.daily_time_chosen,
+    )
 
     # Build confirmation message
     lines = ["✅ <b>Уведомления настроены!</b>\n"]
@@ -221,5 +283,6 @@ async def save_settings_and_finish(callback: CallbackQuery, state: FSMContext) -
 
     lines.append("\nНажмите /start для изменения настроек.")
 
+    keyboard_edits.cancel(callback.message)
     await callback.message.edit_text("\n".join(lines), parse_mode="HTML")
     await state.clear()
@@ -1,10 +1,14 @@
 from .inline import (
+    ALERT_THRESHOLDS,
+    get_location_keyboard,
     get_notification_choices_keyboard,
     get_time_keyboard,
     get_threshold_keyboard,
 )
 
 __all__ = [
+    "ALERT_THRESHOLDS",
+    "get_location_keyboard",
     "get_notification_choices_keyboard",
     "get_time_keyboard",
     "get_threshold_keyboard",
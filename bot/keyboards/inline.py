@@ -1,6 +1,23 @@
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from bot.services.locations import DEFAULT_LOCATION, LOCATIONS
+
+# The state space is tiny, so every keyboard is built once and then shared.
+# Callers must not modify the returned markup. The caches are bounded, the
+# arguments come from FSM data that clients can influence.
+
+# Alert thresholds offered on screen 3
+ALERT_THRESHOLDS = (
+    (101, "вредно для уязвимых групп"),
+    (151, "вредно"),
+    (201, "очень вредно"),
+    (301, "опасно"),
+)
+
 
+@lru_cache(maxsize=4)
 def get_notification_choices_keyboard(
     daily_enabled: bool = True, alert_enabled: bool = True
 ) -> InlineKeyboardMarkup:
@@ -29,6 +46,7 @@ def get_notification_choices_keyboard(
     )
 
 
+@lru_cache(maxsize=512)  # 24 hours * 12 five-minute steps, plus a few odd minutes
 def get_time_keyboard(hour: int = 8, minute: int = 0) -> InlineKeyboardMarkup:
     """Screen 2: Time selection for daily notifications"""
     return InlineKeyboardMarkup(
@@ -51,17 +69,11 @@ def get_time_keyboard(hour: int = 8, minute: int = 0) -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=8)
 def get_threshold_keyboard(selected_threshold: int = 101) -> InlineKeyboardMarkup:
     """Screen 3: AQI threshold selection"""
-    thresholds = [
-        (101, "вредно для уязвимых групп"),
-        (151, "вредно"),
-        (201, "очень вредно"),
-        (301, "опасно"),
-    ]
-
     buttons = []
-    for threshold, description in thresholds:
+    for threshold, description in ALERT_THRESHOLDS:
         icon = "✅" if threshold == selected_threshold else "◽"
         buttons.append(
             [
@@ -75,3 +87,21 @@ def get_threshold_keyboard(selected_threshold: int = 101) -> InlineKeyboardMarku
     buttons.append([InlineKeyboardButton(text="Готово", callback_data="threshold_done")])
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+@lru_cache(maxsize=32)
+def get_location_keyboard(selected_location: str = DEFAULT_LOCATION) -> InlineKeyboardMarkup:
+    """City selection for air quality data"""
+    buttons = []
+    for location in LOCATIONS.values():
+        icon = "✅" if location.key == selected_location else "◽"
+        buttons.append(
+            [
+                InlineKeyboardButton(
+                    text=f"{icon} {location.name}",
+                    callback_data=f"location_{location.key}",
+                )
+            ]
+        )
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -4,12 +4,25 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiohttp import web
 
 from bot.config import settings
-from bot.database import init_db
+from bot.database import (
+    DatabaseStorage,
+    UserRepository,
+    async_read_session,
+    check_schema,
+    dispose_engines,
+    warm_up_pool,
+)
 from bot.handlers import setup_routers
+from bot.middlewares import TracingRequestMiddleware, setup_middlewares
+from bot.services.iqair import iqair_service
+from bot.services.outbox import NotificationOutbox
+from bot.services.profiler import profiler
 from bot.services.scheduler import NotificationScheduler
+from bot.tracing import trace_exporter
+from bot.web import readiness, run_webhook, setup_health, setup_metrics, start_web_server
 
 # Configure logging
 logging.basicConfig(
@@ -19,34 +32,94 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def warm_up_database() -> None:
+    try:
+        await warm_up_pool(settings.db_pool_warmup)
+        readiness.mark("database")
+    except Exception as e:
+        logger.exception(f"Database warm-up failed: {e}")
+
+
+async def warm_up_iqair() -> None:
+    # Failures are served from the error path later, the attempt is what counts.
+    # Cities nobody picked would only spend the API budget.
+    try:
+        async with async_read_session() as session:
+            locations = await UserRepository(session).get_subscribed_locations()
+        await asyncio.gather(*(iqair_service.get_air_quality(key) for key in locations))
+    except Exception as e:
+        logger.exception(f"IQAir warm-up failed: {e}")
+    readiness.mark("iqair")
+
+
+async def on_polling_started() -> None:
+    readiness.mark("updates")
+
+
 async def main() -> None:
     logger.info("Starting AlmatyAir bot...")
 
-    # Initialize database
-    await init_db()
-    logger.info("Database initialized")
+    # Migrations are applied by `alembic upgrade head` before the bot starts
+    try:
+        revision = await check_schema()
+    except Exception:
+        await dispose_engines()
+        raise
+    logger.info(f"Database schema at revision {revision}")
 
     # Initialize bot and dispatcher
     bot = Bot(
         token=settings.bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    dp = Dispatcher(storage=MemoryStorage())
+    bot.session.middleware(TracingRequestMiddleware())
+    dp = Dispatcher(storage=DatabaseStorage())
 
     # Setup routers
     dp.include_router(setup_routers())
+    setup_middlewares(dp)
+
+    # HTTP endpoints shared by webhook, health checks and metrics
+    app = web.Application()
+    setup_health(app)
+    if settings.metrics_enabled:
+        setup_metrics(app)
 
-    # Initialize and start scheduler
-    scheduler = NotificationScheduler(bot)
+    # Warm up the DB pool and IQAir cache while updates are being set up
+    warm_up = asyncio.gather(warm_up_database(), warm_up_iqair())
+
+    trace_exporter.start()
+    profiler.start()
+
+    # The scheduler runs the outbox workers while it holds its shard's leader lock
+    outbox = NotificationOutbox(bot)
+    scheduler = NotificationScheduler(bot, outbox)
     scheduler.start()
 
+    runner = None
     try:
-        # Start polling
         logger.info("Bot is running...")
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if settings.webhook_url:
+            await run_webhook(dp, bot, app)
+        else:
+            if settings.metrics_enabled or settings.health_enabled:
+                runner = await start_web_server(app)
+
+            # Polling is kept for development
+            dp.startup.register(on_polling_started)
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
-        scheduler.stop()
+        warm_up.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        await scheduler.stop()
+        await outbox.stop()
+        await trace_exporter.stop()
+        await profiler.stop()
+        await iqair_service.close()
         await bot.session.close()
+        await dispose_engines()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import functools
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# IQAir
+IQAIR_FETCH_SECONDS = Histogram(
+    "iqair_fetch_seconds", "IQAir upstream request latency", ["location"]
+)
+IQAIR_CACHE = Counter("iqair_cache_requests_total", "IQAir cache lookups", ["result"])
+IQAIR_CACHE_HIT = IQAIR_CACHE.labels("hit")
+IQAIR_CACHE_MISS = IQAIR_CACHE.labels("miss")
+IQAIR_ERRORS = Counter("iqair_errors_total", "IQAir upstream errors", ["reason"])
+
+# External API quotas
+API_BUDGET_USED = Gauge(
+    "api_budget_used", "API calls spent in the current period", ["api", "period"]
+)
+API_BUDGET_LIMIT = Gauge(
+    "api_budget_limit", "API call limit per period, 0 is unlimited", ["api", "period"]
+)
+API_BUDGET_REJECTED = Counter(
+    "api_budget_rejected_total", "API calls refused by the budget", ["api"]
+)
+
+# Scheduler
+JOB_SECONDS = Histogram(
+    "scheduler_job_seconds",
+    "Scheduler job duration",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+JOB_USERS = Gauge("scheduler_job_users", "Users processed by the last job run", ["job"])
+
+# Telegram
+SEND_SECONDS = Histogram("telegram_send_seconds", "Bot API send_message latency")
+SEND_FAILURES = Counter(
+    "telegram_send_failures_total", "Failed send_message calls", ["error"]
+)
+OUTBOX_MERGED = Counter("outbox_merged_total", "Notifications merged into another one")
+DELIVERY_PLANNED_PEAK = Gauge(
+    "delivery_planned_peak_per_second", "Most notifications planned for one upcoming second"
+)
+
+# Event loop
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the loop monitor's wake-ups",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+# Startup
+STARTUP_SECONDS = Gauge(
+    "startup_seconds", "Seconds from process start to a startup stage", ["stage"]
+)
+
+# Handlers
+USER_CACHE = Counter(
+    "user_settings_cache_requests_total", "User settings cache lookups", ["result"]
+)
+USER_CACHE_HIT = USER_CACHE.labels("hit")
+USER_CACHE_MISS = USER_CACHE.labels("miss")
+HANDLER_SECONDS = Histogram("handler_seconds", "Update handler latency", ["handler"])
+THROTTLED = Counter("throttled_updates_total", "Updates dropped by user throttling", ["event"])
+THROTTLED_USERS = Gauge("throttled_users", "Users with a throttling bucket in memory")
+KEYBOARD_EDITS = Counter(
+    "keyboard_edits_total", "Debounced setup keyboard edits", ["result"]
+)
+
+
+def observe_job(job: str) -> Callable:
+    """Record the duration of an async scheduler job"""
+    histogram = JOB_SECONDS.labels(job)
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with histogram.time():
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,34 @@
+from aiogram import Dispatcher
+
+from .metrics import HandlerMetricsMiddleware
+from .startup import FirstResponseMiddleware
+from .throttling import ThrottlingMiddleware
+from .tracing import TracingMiddleware, TracingRequestMiddleware
+
+
+def setup_middlewares(dp: Dispatcher) -> None:
+    # Trace ahead of the FSM middleware so its state lookup is part of the trace
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(TracingMiddleware())
+    dp.update.outer_middleware(dp.fsm)
+
+    dp.update.outer_middleware(FirstResponseMiddleware())
+
+    # Before filters and handlers, so spam never reaches the Bot API
+    throttling = ThrottlingMiddleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+
+    metrics = HandlerMetricsMiddleware()
+    dp.message.middleware(metrics)
+    dp.callback_query.middleware(metrics)
+
+
+__all__ = [
+    "FirstResponseMiddleware",
+    "HandlerMetricsMiddleware",
+    "ThrottlingMiddleware",
+    "TracingMiddleware",
+    "TracingRequestMiddleware",
+    "setup_middlewares",
+]
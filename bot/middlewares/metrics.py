@@ -0,0 +1,29 @@
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.metrics import HANDLER_SECONDS
+from bot.tracing import span
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Observe handler latency, labelled by handler function name"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+
+        started = time.perf_counter()
+        try:
+            with span(f"handler {name}"):
+                return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
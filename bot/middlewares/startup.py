@@ -0,0 +1,23 @@
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject
+
+from bot.web.health import readiness
+
+
+class FirstResponseMiddleware(BaseMiddleware):
+    """Log the time from process start to the first handled update"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        result = await handler(event, data)
+        if not readiness.first_response_logged and result is not UNHANDLED:
+            readiness.mark_first_response()
+        return result
@@ -0,0 +1,66 @@
+import logging
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from bot.config import settings
+from bot.metrics import THROTTLED, THROTTLED_USERS
+from bot.services.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Drop commands and button presses of users who send them too fast
+
+    Every user gets a token bucket refilled at ``throttle_rate``. Buckets are
+    kept in an LRU of ``throttle_cache_size`` users, an evicted user simply
+    starts again with a full bucket. Over-limit callbacks are answered without
+    text so the button stops spinning, over-limit messages are ignored.
+    """
+
+    def __init__(self):
+        self._buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or self._bucket(user.id).try_consume(self._cost(event)):
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery):
+            THROTTLED.labels("callback_query").inc()
+            await event.answer()
+        else:
+            THROTTLED.labels("message").inc()
+        logger.debug(f"Throttled update from user {user.id}")
+        return None
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(settings.throttle_rate, settings.throttle_burst)
+            self._buckets[user_id] = bucket
+            while len(self._buckets) > settings.throttle_cache_size:
+                self._buckets.popitem(last=False)
+            THROTTLED_USERS.set(len(self._buckets))
+        else:
+            self._buckets.move_to_end(user_id)
+        return bucket
+
+    @staticmethod
+    def _cost(event: TelegramObject) -> float:
+        key = None
+        if isinstance(event, CallbackQuery):
+            key = event.data
+        elif isinstance(event, Message) and event.text and event.text.startswith("/"):
+            # /air@AlmatyAirBot 123 -> /air
+            key = event.text.split(maxsplit=1)[0].split("@", 1)[0]
+        return settings.throttle_costs.get(key, 1.0)
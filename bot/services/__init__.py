@@ -1,4 +1,15 @@
 from .iqair import IQAirService, AirQualityData, WeatherData
+from .broadcast import Broadcaster, DeliveryReport, OutgoingMessage
+from .outbox import NotificationOutbox
 from .scheduler import NotificationScheduler
 
-__all__ = ["IQAirService", "AirQualityData", "WeatherData", "NotificationScheduler"]
+__all__ = [
+    "IQAirService",
+    "AirQualityData",
+    "WeatherData",
+    "Broadcaster",
+    "DeliveryReport",
+    "OutgoingMessage",
+    "NotificationOutbox",
+    "NotificationScheduler",
+]
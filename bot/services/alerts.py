@@ -0,0 +1,47 @@
+"""AQI alert rules shared by the scheduler, the settings handlers and the database query
+
+Alert levels are coarser than ``aqi_level``: everything up to 100 counts as
+good, and the boundaries match the thresholds users can pick.
+"""
+
+ALERT_LEVELS = (
+    (301, "hazardous"),
+    (201, "very_unhealthy"),
+    (151, "unhealthy"),
+    (101, "unhealthy_sensitive"),
+)
+
+# good is 0, unknown levels (NULL, 'moderate' from old rows) count as good too
+LEVEL_RANKS = {level: rank for rank, (_, level) in enumerate(reversed(ALERT_LEVELS), start=1)}
+
+
+def alert_level(aqi: int) -> str:
+    """Determine the alert level category"""
+    for lower_bound, level in ALERT_LEVELS:
+        if aqi >= lower_bound:
+            return level
+    return "good"
+
+
+def level_rank(level: str | None) -> int:
+    return LEVEL_RANKS.get(level, 0)
+
+
+def decide_alert(aqi: int, threshold: int, last_level: str | None) -> str | None:
+    """Return the alert type a user should get for the current AQI, if any
+
+    A user is alerted when the AQI crosses their threshold: "warning" when the
+    last level was below the threshold's level and the AQI is at or above the
+    threshold now, "improved" the other way round.
+
+    UserRepository.get_alert_recipients selects exactly the users this returns
+    an alert for, keep both in sync (tests/test_alerts.py checks it).
+    """
+    was_above = level_rank(last_level) >= level_rank(alert_level(threshold))
+    if aqi >= threshold and not was_above:
+        # AQI exceeded threshold
+        return "warning"
+    if aqi < threshold and was_above:
+        # AQI improved below the threshold
+        return "improved"
+    return None
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from bot.config import settings
+from bot.metrics import SEND_FAILURES, SEND_SECONDS
+from bot.services.ratelimit import ChatRateLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutgoingMessage:
+    chat_id: int
+    text: str
+    kind: str = "message"  # daily, warning or improved for notifications
+    outbox_id: int | None = None
+    send_at: datetime | None = None  # Planned delivery time, see DeliveryPlanner
+    error: str | None = None  # Last delivery error
+
+
+@dataclass
+class DeliveryReport:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    elapsed: float = 0.0  # seconds
+
+    # Failed messages: worth retrying later / rejected by Telegram for good
+    retryable: list[OutgoingMessage] = field(default_factory=list, repr=False)
+    rejected: list[OutgoingMessage] = field(default_factory=list, repr=False)
+
+    def __str__(self) -> str:
+        return (
+            f"sent {self.sent}/{self.total}, failed {self.failed}, "
+            f"retried {self.retried}, took {self.elapsed:.2f}s"
+        )
+
+
+class Broadcaster:
+    """Delivers messages through a bounded pool of rate-limited senders"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.workers = settings.broadcast_workers
+        self.max_retries = settings.broadcast_max_retries
+        # Every shard leader sends, together they stay within the bot's limit
+        self._bucket = TokenBucket(settings.broadcast_rate_limit / settings.shard_count)
+        self._chat_limiter = ChatRateLimiter(settings.broadcast_chat_interval)
+
+    async def broadcast(self, messages: Iterable[OutgoingMessage]) -> DeliveryReport:
+        queue: asyncio.Queue[OutgoingMessage] = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+
+        report = DeliveryReport(total=queue.qsize())
+        if not report.total:
+            return report
+
+        started = time.monotonic()
+        workers = [
+            asyncio.create_task(self._worker(queue, report))
+            for _ in range(min(self.workers, report.total))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self._chat_limiter.cleanup()
+
+        report.elapsed = time.monotonic() - started
+        return report
+
+    async def _worker(self, queue: asyncio.Queue[OutgoingMessage], report: DeliveryReport) -> None:
+        while not queue.empty():
+            message = queue.get_nowait()
+            result = await self._deliver(message, report)
+            if result == "sent":
+                report.sent += 1
+                continue
+
+            report.failed += 1
+            if result == "retry":
+                report.retryable.append(message)
+            else:
+                report.rejected.append(message)
+
+    async def _deliver(self, message: OutgoingMessage, report: DeliveryReport) -> str:
+        """Send one message, returning sent, retry or rejected"""
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            await self._chat_limiter.wait(message.chat_id)
+
+            started = time.perf_counter()
+            try:
+                await self.bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    parse_mode="HTML",
+                )
+                SEND_SECONDS.observe(time.perf_counter() - started)
+                logger.debug(f"Sent message to {message.chat_id}")
+                return "sent"
+            except TelegramRetryAfter as e:
+                # Flood control is global for the bot, so every sender backs off
+                SEND_FAILURES.labels(type(e).__name__).inc()
+                message.error = str(e)
+                logger.warning(f"Flood control hit, retrying in {e.retry_after}s")
+                self._bucket.block_for(e.retry_after)
+                self._chat_limiter.block_for(message.chat_id, e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                # Transient: the network or a Telegram 5xx, the message itself is fine
+                SEND_FAILURES.labels(type(e).__name__).inc()
+                message.error = str(e)
+                logger.warning(f"Temporary error sending to {message.chat_id}: {e}")
+                await asyncio.sleep(2**attempt)
+            except Exception as e:
+                SEND_FAILURES.labels(type(e).__name__).inc()
+                message.error = str(e)
+                logger.error(f"Failed to send message to {message.chat_id}: {e}")
+                return "rejected"
+
+            if attempt < self.max_retries:
+                report.retried += 1
+
+        logger.warning(f"Giving up on {message.chat_id} for now after {self.max_retries} retries")
+        return "retry"
@@ -0,0 +1,59 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import pytz
+
+from bot.config import settings
+from bot.metrics import DELIVERY_PLANNED_PEAK
+from bot.services.broadcast import OutgoingMessage
+
+ALMATY_TZ = pytz.timezone("Asia/Almaty")
+
+class DeliveryPlanner:
+    """Spreads notification batches over the following minutes to flatten peaks
+
+    Send slots are planned per second from the broadcast rate limit. Strict
+    batches take the earliest free slots within ``daily_strict_window``.
+    Flexible ones spread over ``daily_spread_seconds`` and may only fill part
+    of each second, so strict batches of the next minutes still find room.
+    """
+
+    def __init__(self, rate: float):
+        self.capacity = max(int(rate), 1)  # messages per second
+        self._load: dict[int, int] = {}  # unix second -> planned messages
+
+    def plan(
+        self, messages: list[OutgoingMessage], start: datetime, strict: bool
+    ) -> dict[str, int]:
+        """Set send_at on the messages, returning the planned count per minute"""
+        if not messages:
+            return {}
+
+        first = math.ceil(start.timestamp())
+        self._prune(first)
+        if strict:
+            window, limit = settings.daily_strict_window, self.capacity
+        else:
+            window = settings.daily_spread_seconds
+            limit = max(int(self.capacity * settings.daily_flexible_share), 1)
+        end = first + max(window, 1)
+
+        curve: dict[str, int] = defaultdict(int)
+        second = first
+        for i, message in enumerate(messages):
+            while second < end and self._load.get(second, 0) >= limit:
+                second += 1
+            # Over capacity for the whole window: spread the rest evenly over it
+            slot = second if second < end else first + i % (end - first)
+
+            self._load[slot] = self._load.get(slot, 0) + 1
+            message.send_at = datetime.fromtimestamp(slot, timezone.utc)
+            curve[f"{message.send_at.astimezone(ALMATY_TZ):%H:%M}"] += 1
+
+        DELIVERY_PLANNED_PEAK.set(max(self._load.values()))
+        return dict(curve)
+
+    def _prune(self, now: int) -> None:
+        for second in [second for second in self._load if second < now]:
+            del self._load[second]
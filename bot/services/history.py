@@ -0,0 +1,98 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from bot.config import settings
+from bot.database import AqiHistoryRepository, AqiReading, async_session
+from bot.database.repository import ALMATY_TZ, day_bucket, hour_bucket
+from bot.services.iqair import LEVEL_EMOJIS, AirQualityData, aqi_level
+from bot.services.locations import get_location
+from bot.tracing import span
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+class HistoryService:
+    """Buffers AQI readings and reads trend data from the rollup tables"""
+
+    def __init__(self):
+        self._pending: list[AqiReading] = []
+
+    def record(self, air_data: AirQualityData) -> None:
+        self._pending.append(
+            AqiReading(
+                location=air_data.location,
+                aqi=air_data.aqi,
+                main_pollutant=air_data.main_pollutant,
+                measured_at=air_data.timestamp.astimezone(timezone.utc),
+            )
+        )
+
+    async def flush(self) -> int:
+        """Write buffered readings in one batch, keeping them on failure"""
+        if not self._pending:
+            return 0
+
+        batch, self._pending = self._pending, []
+        try:
+            async with async_session() as session:
+                repo = AqiHistoryRepository(session)
+                return await repo.add_readings(batch)
+        except Exception as e:
+            logger.error(f"Failed to store {len(batch)} AQI readings: {e}")
+            self._pending = (batch + self._pending)[-settings.history_buffer_size :]
+            return 0
+
+    async def apply_retention(self) -> None:
+        """Drop raw readings and hourly rollups that have been downsampled"""
+        now = datetime.now(timezone.utc)
+        async with async_session() as session:
+            repo = AqiHistoryRepository(session)
+            readings = await repo.delete_readings_before(
+                hour_bucket(now - timedelta(days=settings.history_raw_retention_days))
+            )
+            hourly = await repo.delete_hourly_before(
+                day_bucket(now - timedelta(days=settings.history_hourly_retention_days))
+            )
+        logger.info(f"AQI history retention: removed {readings} readings, {hourly} hourly rollups")
+
+    async def format_history(self, location: str) -> str | None:
+        now = datetime.now(timezone.utc)
+        with span("db history.get"):
+            async with async_session() as session:
+                repo = AqiHistoryRepository(session)
+                daily = await repo.get_daily(
+                    location, day_bucket(now - timedelta(days=settings.history_days - 1))
+                )
+                hourly = await repo.get_hourly(
+                    location, hour_bucket(now - timedelta(hours=23))
+                )
+
+        if not daily:
+            return None
+
+        lines = [f"📈 <b>Качество воздуха в {get_location(location).title}</b>\n"]
+
+        if hourly:
+            today_avg = round(sum(h.aqi_sum for h in hourly) / sum(h.samples for h in hourly))
+            today_max = max(h.aqi_max for h in hourly)
+            lines.append(
+                f"<b>За 24 часа:</b> {LEVEL_EMOJIS[aqi_level(today_avg)]} "
+                f"средний AQI {today_avg}, максимум {today_max}\n"
+            )
+
+        lines.append("<b>По дням:</b>")
+        for day in daily:
+            local_day = day.bucket.astimezone(ALMATY_TZ)
+            lines.append(
+                f"{WEEKDAYS[local_day.weekday()]} {local_day:%d.%m}: "
+                f"{LEVEL_EMOJIS[aqi_level(day.aqi_avg)]} {day.aqi_avg} "
+                f"({day.aqi_min}–{day.aqi_max})"
+            )
+
+        return "\n".join(lines)
+
+
+# Singleton instance
+history_service = HistoryService()
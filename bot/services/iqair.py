@@ -1,14 +1,68 @@
+import asyncio
 import logging
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 
 import aiohttp
+from prometheus_client import Histogram
 
 from bot.config import settings
+from bot.metrics import IQAIR_CACHE_HIT, IQAIR_CACHE_MISS, IQAIR_ERRORS, IQAIR_FETCH_SECONDS
+from bot.services.locations import DEFAULT_LOCATION, get_location
+from bot.services.quota import QuotaBudget
+from bot.tracing import detached_task, span
 
 logger = logging.getLogger(__name__)
 
 
+LEVEL_EMOJIS = {
+    "good": "🟢",
+    "moderate": "🟡",
+    "unhealthy_sensitive": "🟠",
+    "unhealthy": "🔴",
+    "very_unhealthy": "🟣",
+    "hazardous": "🟤",
+}
+
+
+GREETINGS = ("🌅 Доброе утро!", "🌤 Добрый день!", "🌆 Добрый вечер!", "🌙 Доброй ночи!")
+
+ALERT_PREFIXES = {
+    "warning": "⚠️ <b>Внимание! Качество воздуха ухудшилось</b>",
+    "improved": "✅ <b>Качество воздуха улучшилось!</b>",
+}
+
+
+def get_greeting(hour: int) -> str:
+    """Return appropriate greeting based on hour"""
+    if 5 <= hour < 12:
+        return GREETINGS[0]
+    elif 12 <= hour < 18:
+        return GREETINGS[1]
+    elif 18 <= hour < 23:
+        return GREETINGS[2]
+    else:
+        return GREETINGS[3]
+
+
+def aqi_level(aqi: int) -> str:
+    if aqi <= 50:
+        return "good"
+    elif aqi <= 100:
+        return "moderate"
+    elif aqi <= 150:
+        return "unhealthy_sensitive"
+    elif aqi <= 200:
+        return "unhealthy"
+    elif aqi <= 300:
+        return "very_unhealthy"
+    else:
+        return "hazardous"
+
+
 @dataclass
 class WeatherData:
     temperature: int  # Celsius
@@ -24,35 +78,28 @@ class WeatherData:
 class AirQualityData:
     aqi: int
     main_pollutant: str
-    timestamp: datetime
+    timestamp: datetime  # Upstream measurement time, UTC
     weather: WeatherData | None = None
+    location: str = DEFAULT_LOCATION
+
+    # Pre-rendered message variants, built once per snapshot
+    _messages: dict[str, str] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        plain = self._render()
+        self._messages["plain"] = plain
+        for greeting in GREETINGS:
+            self._messages[greeting] = f"<b>{greeting}</b>\n\n{plain}"
+        for alert_type, prefix in ALERT_PREFIXES.items():
+            self._messages[alert_type] = f"{prefix}\n\n{plain}"
 
     @property
     def level(self) -> str:
-        if self.aqi <= 50:
-            return "good"
-        elif self.aqi <= 100:
-            return "moderate"
-        elif self.aqi <= 150:
-            return "unhealthy_sensitive"
-        elif self.aqi <= 200:
-            return "unhealthy"
-        elif self.aqi <= 300:
-            return "very_unhealthy"
-        else:
-            return "hazardous"
+        return aqi_level(self.aqi)
 
     @property
     def level_emoji(self) -> str:
-        levels = {
-            "good": "🟢",
-            "moderate": "🟡",
-            "unhealthy_sensitive": "🟠",
-            "unhealthy": "🔴",
-            "very_unhealthy": "🟣",
-            "hazardous": "🟤",
-        }
-        return levels.get(self.level, "⚪")
+        return LEVEL_EMOJIS.get(self.level, "⚪")
 
     @property
     def level_text(self) -> str:
@@ -79,12 +126,21 @@ class AirQualityData:
         return recommendations.get(self.level, "")
 
     def format_message(self) -> str:
+        return self._messages["plain"]
+
+    def daily_message(self, hour: int) -> str:
+        return self._messages[get_greeting(hour)]
+
+    def alert_message(self, alert_type: str) -> str:
+        return self._messages[alert_type]
+
+    def _render(self) -> str:
         weather_line = ""
         if self.weather:
             weather_line = f"\n{self.weather.format_line()}\n"
 
         return (
-            f"{self.level_emoji} <b>Качество воздуха в Алматы</b>\n"
+            f"{self.level_emoji} <b>Качество воздуха в {get_location(self.location).title}</b>\n"
             f"{weather_line}\n"
             f"<b>AQI:</b> {self.aqi}\n"
             f"<b>Состояние:</b> {self.level_text}\n"
@@ -105,73 +161,203 @@ class AirQualityData:
 
 
 class IQAirService:
+    """IQAir client that only calls the API when a new measurement is expected
+
+    IQAir publishes roughly one measurement per hour. After each fetch the next
+    one is planned for the expected update time, or retried a bit later if the
+    reading has not changed yet, and spaced out further if needed to stay
+    within the daily and monthly call budget. Until then the cached reading
+    is served.
+    """
+
     BASE_URL = "http://api.airvisual.com/v2"
-    CACHE_TTL = timedelta(minutes=10)
 
     def __init__(self):
-        self._cache: AirQualityData | None = None
-        self._cache_time: datetime | None = None
+        # Bounded LRU of location key -> latest reading
+        self._cache: OrderedDict[str, AirQualityData] = OrderedDict()
+        self._next_fetch: dict[str, datetime] = {}
+        self._polled: dict[str, datetime] = {}  # location -> measurement returned by poll()
+        self._session: aiohttp.ClientSession | None = None
+        self._inflight: dict[str, asyncio.Task[AirQualityData | None]] = {}
+        # Per-location histogram children, labels() looks them up under a lock
+        self._fetch_seconds: dict[str, Histogram] = {}
+        self.budget = QuotaBudget(
+            "iqair", settings.iqair_daily_budget, settings.iqair_monthly_budget
+        )
 
-    async def get_air_quality(self, force_refresh: bool = False) -> AirQualityData | None:
-        # Return cached data if still valid
-        if not force_refresh and self._is_cache_valid():
-            return self._cache
+    def _get_session(self) -> aiohttp.ClientSession:
+        # One long-lived session keeps connections alive and caches DNS
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.iqair_pool_size,
+                ttl_dns_cache=settings.iqair_dns_cache_ttl,
+                keepalive_timeout=settings.iqair_keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(
+                connect=settings.iqair_connect_timeout,
+                sock_read=settings.iqair_read_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def get_air_quality(
+        self, location: str = DEFAULT_LOCATION, force_refresh: bool = False
+    ) -> AirQualityData | None:
+        location = get_location(location).key
+
+        # Return cached data until the next fetch is due. Without any, e.g. while
+        # the budget is exhausted, callers get None instead of a budget check each.
+        if not force_refresh and not self._fetch_due(location):
+            air_data = self._get_cached(location)
+            (IQAIR_CACHE_HIT if air_data else IQAIR_CACHE_MISS).inc()
+            return air_data
+        IQAIR_CACHE_MISS.inc()
+
+        # Concurrent callers share a single upstream request per location
+        task = self._inflight.get(location)
+        if task is None:
+            task = detached_task(self._fetch(location))
+            self._inflight[location] = task
+            task.add_done_callback(lambda t: self._clear_inflight(location, t))
+
+        with span("iqair", location=location):
+            return await asyncio.shield(task)
+
+    async def poll(self, locations: Iterable[str]) -> dict[str, AirQualityData]:
+        """Return readings measured since the previous poll, fetching only when due"""
+        locations = list(dict.fromkeys(get_location(location).key for location in locations))
+        results = await asyncio.gather(*(self.get_air_quality(location) for location in locations))
+
+        readings = {}
+        for location, air_data in zip(locations, results):
+            if air_data is None or self._polled.get(location) == air_data.timestamp:
+                continue
+            self._polled[location] = air_data.timestamp
+            readings[location] = air_data
+        return readings
+
+    def _clear_inflight(self, location: str, task: asyncio.Task) -> None:
+        if self._inflight.get(location) is task:
+            del self._inflight[location]
+
+    async def _fetch(self, location: str) -> AirQualityData | None:
+        if not await self.budget.try_spend():
+            IQAIR_ERRORS.labels("budget").inc()
+            self._plan_next_fetch(location)
+            return self._get_cached(location)
 
         try:
-            async with aiohttp.ClientSession() as session:
-                params = {
-                    "city": "Almaty",
-                    "state": "Almaty Oblysy",
-                    "country": "Kazakhstan",
-                    "key": settings.iqair_api_key,
-                }
-
-                async with session.get(f"{self.BASE_URL}/city", params=params) as response:
-                    if response.status != 200:
-                        logger.error(f"IQAir API error: {response.status}")
-                        return self._cache  # Return stale cache on error
-
-                    data = await response.json()
-
-                    if data.get("status") != "success":
-                        logger.error(f"IQAir API error: {data}")
-                        return self._cache
-
-                    current = data["data"]["current"]
-                    pollution = current["pollution"]
-
-                    # Parse weather data
-                    weather = None
-                    if "weather" in current:
-                        w = current["weather"]
-                        weather = WeatherData(
-                            temperature=w.get("tp", 0),
-                            humidity=w.get("hu", 0),
-                            wind_speed=w.get("ws", 0),
-                            pressure=w.get("pr", 0),
-                        )
-
-                    air_data = AirQualityData(
-                        aqi=pollution["aqius"],
-                        main_pollutant=pollution["mainus"],
-                        timestamp=datetime.now(),
-                        weather=weather,
+            session = self._get_session()
+            params = {**get_location(location).params, "key": settings.iqair_api_key}
+
+            started = time.perf_counter()
+            async with session.get(f"{self.BASE_URL}/city", params=params) as response:
+                if response.status != 200:
+                    IQAIR_ERRORS.labels(f"http_{response.status}").inc()
+                    logger.error(f"IQAir API error for {location}: {response.status}")
+                    self._plan_next_fetch(location)
+                    return self._get_cached(location)  # Return stale cache on error
+
+                data = await response.json()
+                self._fetch_histogram(location).observe(time.perf_counter() - started)
+
+                if data.get("status") != "success":
+                    IQAIR_ERRORS.labels("api").inc()
+                    logger.error(f"IQAir API error for {location}: {data}")
+                    self._plan_next_fetch(location)
+                    return self._get_cached(location)
+
+                current = data["data"]["current"]
+                pollution = current["pollution"]
+
+                # Parse weather data
+                weather = None
+                if "weather" in current:
+                    w = current["weather"]
+                    weather = WeatherData(
+                        temperature=w.get("tp", 0),
+                        humidity=w.get("hu", 0),
+                        wind_speed=w.get("ws", 0),
+                        pressure=w.get("pr", 0),
                     )
 
-                    # Update cache
-                    self._cache = air_data
-                    self._cache_time = datetime.now()
+                air_data = AirQualityData(
+                    aqi=pollution["aqius"],
+                    main_pollutant=pollution["mainus"],
+                    timestamp=self._parse_timestamp(pollution.get("ts")),
+                    weather=weather,
+                    location=location,
+                )
+
+                previous = self._get_cached(location)
+                changed = previous is None or previous.timestamp != air_data.timestamp
+                self._plan_next_fetch(location, air_data.timestamp if changed else None)
+                logger.info(
+                    f"IQAir {location}: AQI {air_data.aqi} measured {air_data.timestamp:%H:%M}"
+                    f"{'' if changed else ' (unchanged)'}, next fetch "
+                    f"{self._next_fetch[location]:%H:%M} UTC, budget {self.budget}"
+                )
 
-                    return air_data
+                # Update cache
+                self._put_cached(location, air_data)
+
+                return air_data
 
         except Exception as e:
-            logger.exception(f"Error fetching air quality data: {e}")
-            return self._cache
+            IQAIR_ERRORS.labels(type(e).__name__).inc()
+            logger.exception(f"Error fetching air quality data for {location}: {e}")
+            self._plan_next_fetch(location)
+            return self._get_cached(location)
+
+    def _fetch_histogram(self, location: str) -> Histogram:
+        histogram = self._fetch_seconds.get(location)
+        if histogram is None:
+            histogram = self._fetch_seconds[location] = IQAIR_FETCH_SECONDS.labels(location)
+        return histogram
+
+    @staticmethod
+    def _parse_timestamp(ts: str | None) -> datetime:
+        # e.g. 2024-01-15T08:00:00.000Z
+        if not ts:
+            return datetime.now(timezone.utc)
+        return datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+    def _plan_next_fetch(self, location: str, measured_at: datetime | None = None) -> None:
+        """Plan the next call after a new measurement, or retry later without one"""
+        now = datetime.now(timezone.utc)
+        next_fetch = now + timedelta(minutes=settings.iqair_retry_interval)
+        if measured_at is not None:
+            expected = measured_at + timedelta(
+                minutes=settings.iqair_update_interval + settings.iqair_update_lag
+            )
+            if expected > now:
+                next_fetch = expected
+
+        self._next_fetch[location] = max(
+            next_fetch, now + self.budget.pacing_interval(max(len(self._next_fetch), 1))
+        )
 
-    def _is_cache_valid(self) -> bool:
-        if self._cache is None or self._cache_time is None:
-            return False
-        return datetime.now() - self._cache_time < self.CACHE_TTL
+    def _get_cached(self, location: str) -> AirQualityData | None:
+        air_data = self._cache.get(location)
+        if air_data is None:
+            return None
+        self._cache.move_to_end(location)
+        return air_data
+
+    def _put_cached(self, location: str, air_data: AirQualityData) -> None:
+        self._cache[location] = air_data
+        self._cache.move_to_end(location)
+        while len(self._cache) > settings.iqair_cache_size:
+            evicted, _ = self._cache.popitem(last=False)
+            self._next_fetch.pop(evicted, None)
+
+    def _fetch_due(self, location: str) -> bool:
+        next_fetch = self._next_fetch.get(location)
+        return next_fetch is None or datetime.now(timezone.utc) >= next_fetch
 
 
 # Singleton instance
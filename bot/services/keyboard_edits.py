@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from bot.config import settings
+from bot.metrics import KEYBOARD_EDITS
+from bot.tracing import detached_task
+
+logger = logging.getLogger(__name__)
+
+
+class KeyboardEditDebouncer:
+    """Coalesces rapid keyboard edits of one message into a single trailing edit
+
+    Handlers update the FSM state right away and hand over the new markup.
+    Every press restarts the timer, the markup of the last one is sent once
+    the user pauses for ``keyboard_edit_debounce`` seconds, so quick taps on
+    an arrow cost one Bot API call however long they go on. Call ``cancel``
+    before replacing the message.
+    """
+
+    def __init__(self):
+        # (chat_id, message_id) -> message of the last press and its markup
+        self._pending: dict[tuple[int, int], tuple[Message, InlineKeyboardMarkup]] = {}
+        self._tasks: dict[tuple[int, int], asyncio.Task] = {}
+        self._sending: set[tuple[int, int]] = set()  # edit request in flight
+
+    def edit(self, message: Message, markup: InlineKeyboardMarkup) -> None:
+        key = (message.chat.id, message.message_id)
+        self._pending[key] = (message, markup)
+        task = self._tasks.get(key)
+        if task is not None:
+            KEYBOARD_EDITS.labels("coalesced").inc()
+            # An edit in flight is not interrupted, it schedules the next one itself
+            if key in self._sending:
+                return
+            task.cancel()
+        self._tasks[key] = detached_task(self._send_later(key))
+
+    def cancel(self, message: Message) -> None:
+        key = (message.chat.id, message.message_id)
+        self._pending.pop(key, None)
+        self._sending.discard(key)
+        task = self._tasks.pop(key, None)
+        if task:
+            task.cancel()
+
+    async def _send_later(self, key: tuple[int, int]) -> None:
+        try:
+            await asyncio.sleep(settings.keyboard_edit_debounce)
+            self._sending.add(key)
+            message, markup = self._pending.pop(key)
+
+            # E.g. one tap forward and one back, Telegram would reject the edit
+            if markup == message.reply_markup:
+                KEYBOARD_EDITS.labels("unchanged").inc()
+            else:
+                await message.edit_reply_markup(reply_markup=markup)
+                KEYBOARD_EDITS.labels("sent").inc()
+        except TelegramAPIError as e:
+            logger.warning(f"Failed to edit keyboard in chat {key[0]}: {e}")
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+                self._sending.discard(key)
+
+        # Presses that arrived while the edit was in flight
+        if key in self._pending and key not in self._tasks:
+            self._tasks[key] = detached_task(self._send_later(key))
+
+
+# Singleton instance
+keyboard_edits = KeyboardEditDebouncer()
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from bot.config import settings
+from bot.database.repository import engine
+
+logger = logging.getLogger(__name__)
+
+# First key of the two-key advisory lock, the second one is the shard index
+LOCK_NAMESPACE = 0x414952  # "AIR"
+
+Callback = Callable[[], Awaitable[None]]
+
+
+def owns_chat(telegram_id: int) -> bool:
+    """Whether this replica's shard is responsible for the user"""
+    return telegram_id % settings.shard_count == settings.shard_index
+
+
+class LeaderElection:
+    """Elects one scheduler leader per shard through a PostgreSQL advisory lock
+
+    The lock is held by a dedicated connection, so it is released as soon as
+    the leader process dies or loses its connection and a standby replica
+    picks it up on its next check. SQLite has no advisory locks and is only
+    used for single-process runs, so there this replica is always the leader.
+    """
+
+    def __init__(self, on_elected: Callback, on_demoted: Callback):
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self._conn: AsyncConnection | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Leader election started for shard {settings.shard_index}/{settings.shard_count}"
+        )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._demote()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.is_leader:
+                    await self._check_connection()
+                else:
+                    await self._try_acquire()
+            except Exception as e:
+                logger.error(f"Leader election check failed: {e}")
+                await self._demote()
+            await asyncio.sleep(settings.leader_check_interval)
+
+    async def _try_acquire(self) -> None:
+        if engine.dialect.name == "sqlite":
+            await self._elect()
+            return
+
+        if self._conn is None:
+            conn = await engine.connect()
+            # Autocommit keeps the lock connection from idling inside a transaction
+            self._conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+        result = await self._conn.execute(
+            select(func.pg_try_advisory_lock(LOCK_NAMESPACE, settings.shard_index))
+        )
+        if result.scalar():
+            await self._elect()
+
+    async def _check_connection(self) -> None:
+        # A dropped connection releases the lock, another replica may own it now
+        if self._conn is not None:
+            await self._conn.execute(select(1))
+
+    async def _elect(self) -> None:
+        self.is_leader = True
+        logger.info(f"Became scheduler leader for shard {settings.shard_index}")
+        await self.on_elected()
+
+    async def _demote(self) -> None:
+        if self.is_leader:
+            self.is_leader = False
+            logger.warning(f"Stepped down as scheduler leader for shard {settings.shard_index}")
+            try:
+                await self.on_demoted()
+            except Exception as e:
+                logger.error(f"Failed to pause scheduler: {e}")
+
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            try:
+                # Drop the connection instead of returning it to the pool with the lock held
+                await conn.invalidate()
+                await conn.close()
+            except Exception as e:
+                logger.debug(f"Failed to close leader lock connection: {e}")
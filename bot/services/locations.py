@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Location:
+    key: str
+    name: str  # Shown on buttons
+    title: str  # Prepositional case: "Качество воздуха в {title}"
+
+    # IQAir /v2/city parameters
+    city: str
+    state: str
+    country: str
+
+    @property
+    def params(self) -> dict[str, str]:
+        return {"city": self.city, "state": self.state, "country": self.country}
+
+
+LOCATIONS: dict[str, Location] = {
+    location.key: location
+    for location in (
+        Location("almaty", "Алматы", "Алматы", "Almaty", "Almaty Oblysy", "Kazakhstan"),
+        Location("astana", "Астана", "Астане", "Astana", "Astana", "Kazakhstan"),
+        Location("shymkent", "Шымкент", "Шымкенте", "Shymkent", "Shymkent", "Kazakhstan"),
+    )
+}
+
+DEFAULT_LOCATION = "almaty"
+
+
+def get_location(key: str | None) -> Location:
+    """Return location by key, falling back to the default one"""
+    return LOCATIONS.get(key or DEFAULT_LOCATION, LOCATIONS[DEFAULT_LOCATION])
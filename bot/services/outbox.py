@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.database import OutboxMessage, OutboxRepository, async_session
+from bot.metrics import OUTBOX_MERGED
+from bot.services.broadcast import Broadcaster, OutgoingMessage
+
+logger = logging.getLogger(__name__)
+
+# Notification kinds that may replace each other, every one carries the full
+# current reading. Alerts also say why it matters, so they win over daily ones.
+COALESCE_PRIORITY = {"daily": 0, "warning": 1, "improved": 1}
+
+
+def coalesce(rows: list[OutboxMessage]) -> tuple[list[OutboxMessage], list[OutboxMessage]]:
+    """Keep one notification per chat, returning (to deliver, superseded)"""
+    by_chat: dict[int, list[OutboxMessage]] = defaultdict(list)
+    deliver = []
+    for row in rows:
+        if row.kind in COALESCE_PRIORITY:
+            by_chat[row.chat_id].append(row)
+        else:
+            deliver.append(row)
+
+    merged = []
+    for chat_rows in by_chat.values():
+        # The most important kind wins, the latest one among equals
+        winner = max(chat_rows, key=lambda row: (COALESCE_PRIORITY[row.kind], row.id))
+        deliver.append(winner)
+        merged.extend(row for row in chat_rows if row is not winner)
+    return deliver, merged
+
+
+class NotificationOutbox:
+    """Durable delivery queue: jobs enqueue rows, workers claim and send them"""
+
+    def __init__(self, bot: Bot):
+        self.broadcaster = Broadcaster(bot)
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    async def enqueue(
+        self, messages: list[OutgoingMessage], session: AsyncSession | None = None
+    ) -> int:
+        """Queue messages for delivery
+
+        With a session the rows become part of the caller's transaction; the
+        caller commits and then calls ``wake``.
+        """
+        now = datetime.now(timezone.utc)
+        coalesce_until = now + timedelta(seconds=settings.outbox_coalesce_seconds)
+        rows = [
+            {
+                "chat_id": m.chat_id,
+                "kind": m.kind,
+                "text": m.text,
+                "next_attempt_at": m.send_at
+                or (coalesce_until if m.kind in COALESCE_PRIORITY else now),
+            }
+            for m in messages
+        ]
+        if session is not None:
+            return await OutboxRepository(session).enqueue(rows)
+
+        async with async_session() as session:
+            repo = OutboxRepository(session)
+            count = await repo.enqueue(rows)
+            await session.commit()
+
+        self.wake()
+        return count
+
+    def wake(self) -> None:
+        """Let idle workers pick up newly queued rows right away"""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._run()) for _ in range(settings.outbox_workers)]
+        logger.info(f"Outbox started with {settings.outbox_workers} workers")
+
+    async def stop(self) -> None:
+        # Claimed but unsent rows become due again once their lease expires
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Outbox stopped")
+
+    async def pending(self) -> int:
+        async with async_session() as session:
+            repo = OutboxRepository(session)
+            return await repo.count_pending()
+
+    async def purge(self) -> None:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.outbox_retention_days)
+        async with async_session() as session:
+            repo = OutboxRepository(session)
+            removed = await repo.delete_finished_before(cutoff)
+        logger.info(f"Outbox retention: removed {removed} finished messages")
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                logger.exception(f"Outbox worker failed: {e}")
+                processed = 0
+
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.outbox_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _keep_leases(self, ids: list[int]) -> None:
+        """Extend the lease while a batch is still sending, e.g. through flood control
+
+        Otherwise another worker re-claims the rows once it expires and sends them twice.
+        """
+        lease = timedelta(seconds=settings.outbox_lease_seconds)
+        while True:
+            await asyncio.sleep(settings.outbox_lease_seconds / 3)
+            try:
+                async with async_session() as session:
+                    repo = OutboxRepository(session)
+                    await repo.extend_lease(ids, datetime.now(timezone.utc) + lease)
+            except Exception as e:
+                logger.warning(f"Failed to extend outbox leases: {e}")
+
+    async def process_batch(self) -> int:
+        """Claim, send and settle one batch, returning the number of claimed rows"""
+        async with async_session() as session:
+            repo = OutboxRepository(session)
+            rows = await repo.claim(
+                settings.outbox_batch_size,
+                timedelta(seconds=settings.outbox_lease_seconds),
+                coalesce_kinds=COALESCE_PRIORITY,
+            )
+        if not rows:
+            return 0
+
+        deliver, merged = coalesce(rows)
+        if merged:
+            # Superseded rows are settled before sending, after a crash in between
+            # the winner is still delivered once its lease expires
+            async with async_session() as session:
+                await OutboxRepository(session).mark_merged([row.id for row in merged])
+            OUTBOX_MERGED.inc(len(merged))
+            logger.debug(f"Outbox merged {len(merged)} notifications into others")
+
+        # claim() bumped attempts in the database, the loaded rows hold the old value
+        attempts = {row.id: row.attempts + 1 for row in deliver}
+        keeper = asyncio.create_task(self._keep_leases([row.id for row in deliver]))
+        try:
+            report = await self.broadcaster.broadcast(
+                OutgoingMessage(
+                    chat_id=row.chat_id, text=row.text, kind=row.kind, outbox_id=row.id
+                )
+                for row in deliver
+            )
+        finally:
+            keeper.cancel()
+
+        now = datetime.now(timezone.utc)
+        failed_ids = {m.outbox_id for m in report.retryable + report.rejected}
+        exhausted = [
+            m for m in report.retryable if attempts[m.outbox_id] >= settings.outbox_max_attempts
+        ]
+        retries: dict[datetime, list[OutgoingMessage]] = defaultdict(list)
+        for message in report.retryable:
+            attempt = attempts[message.outbox_id]
+            if attempt < settings.outbox_max_attempts:
+                delay = settings.outbox_retry_base_seconds * 2 ** (attempt - 1)
+                retries[now + timedelta(seconds=delay)].append(message)
+
+        async with async_session() as session:
+            repo = OutboxRepository(session)
+            await repo.mark_sent([row.id for row in deliver if row.id not in failed_ids])
+            for message in report.rejected + exhausted:
+                await repo.mark_failed([message.outbox_id], message.error or "unknown error")
+            for at, messages in retries.items():
+                await repo.reschedule(
+                    [m.outbox_id for m in messages], at, messages[0].error or "unknown error"
+                )
+
+        if report.failed:
+            logger.info(f"Outbox batch: {report}")
+        else:
+            logger.debug(f"Outbox batch: {report}")
+        return len(rows)
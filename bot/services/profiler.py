@@ -0,0 +1,221 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+import weakref
+from datetime import datetime
+from pathlib import Path
+
+from bot.config import settings
+from bot.metrics import EVENT_LOOP_LAG
+
+logger = logging.getLogger(__name__)
+
+TOP_LINES = 30
+
+
+class LoopMonitor:
+    """Measures event loop lag and dumps the loop thread's stack when it stalls
+
+    A task sleeps ``loop_monitor_interval`` and records how late it wakes up.
+    A watchdog thread checks the last wake-up; if the loop has not ticked for
+    ``loop_stall_threshold`` seconds, the blocking code is still on the stack
+    and gets written to the profile directory.
+    """
+
+    def __init__(self, profiler: "Profiler"):
+        self.profiler = profiler
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.first_seen: weakref.WeakKeyDictionary[asyncio.Task, float] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._last_tick = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self._last_tick = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._watch, args=(threading.get_ident(),), name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        interval = settings.loop_monitor_interval
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            self._last_tick = time.monotonic()
+            self.lag = max(self._last_tick - started - interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            EVENT_LOOP_LAG.observe(self.lag)
+
+            for task in asyncio.all_tasks():
+                self.first_seen.setdefault(task, self._last_tick)
+
+    def _watch(self, loop_thread: int) -> None:
+        reported = False
+        while not self._stopped.wait(settings.loop_monitor_interval):
+            stalled = time.monotonic() - self._last_tick - settings.loop_monitor_interval
+            if stalled < settings.loop_stall_threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+
+            # Report each stall once, the frame shows what blocks the loop
+            reported = True
+            frame = sys._current_frames().get(loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "unknown\n"
+            path = self.profiler.write(
+                "stall", f"Event loop blocked for {stalled:.2f}s at:\n{stack}"
+            )
+            logger.warning(f"Event loop blocked for {stalled:.2f}s, stack written to {path}")
+
+
+class Profiler:
+    """On-demand cProfile sessions, tracemalloc diffs and task dumps for the live process
+
+    Triggered by the admin /profile command or by signals: SIGUSR1 starts and
+    stops a CPU profile, SIGUSR2 writes a memory diff and the task stacks.
+    Results are written to ``profile_dir``.
+    """
+
+    def __init__(self):
+        self.monitor = LoopMonitor(self)
+        self._profile: cProfile.Profile | None = None
+        self._profile_started = 0.0
+        self._snapshot: tracemalloc.Snapshot | None = None
+
+    @property
+    def cpu_running(self) -> bool:
+        return self._profile is not None
+
+    def start(self) -> None:
+        self.monitor.start()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, self._toggle_cpu)
+        loop.add_signal_handler(signal.SIGUSR2, self._dump)
+
+    async def stop(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.remove_signal_handler(signal.SIGUSR1)
+        loop.remove_signal_handler(signal.SIGUSR2)
+        await self.monitor.stop()
+        if self.cpu_running:
+            self.stop_cpu()
+
+    def start_cpu(self) -> bool:
+        if self.cpu_running:
+            return False
+        self._profile = cProfile.Profile()
+        self._profile_started = time.monotonic()
+        self._profile.enable()
+        logger.info("CPU profiling started")
+        return True
+
+    def stop_cpu(self) -> tuple[Path, str] | None:
+        """Stop profiling, returning the stats file and the top functions"""
+        if self._profile is None:
+            return None
+        profile, self._profile = self._profile, None
+        profile.disable()
+        elapsed = time.monotonic() - self._profile_started
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_LINES)
+        path = self._path("cpu", "prof")
+        stats.dump_stats(path)
+        summary = f"Profiled {elapsed:.1f}s\n{stream.getvalue()}"
+        self.write("cpu", summary)
+        logger.info(f"CPU profile written to {path}")
+        return path, summary
+
+    def memory_diff(self) -> tuple[Path, str]:
+        """Compare allocations with the previous snapshot, the first call starts tracing"""
+        if not tracemalloc.is_tracing() or self._snapshot is None:
+            tracemalloc.start(settings.tracemalloc_frames)
+            self._snapshot = self._take_snapshot()
+            summary = "tracemalloc started, the next snapshot will show the growth"
+            return self.write("memory", summary), summary
+
+        snapshot = self._take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB"]
+        lines += [str(stat) for stat in snapshot.compare_to(self._snapshot, "lineno")[:TOP_LINES]]
+        self._snapshot = snapshot
+
+        summary = "\n".join(lines)
+        return self.write("memory", summary), summary
+
+    def task_stacks(self) -> tuple[Path, str]:
+        """Stacks of all tasks, the longest running first"""
+        now = time.monotonic()
+        tasks = sorted(
+            asyncio.all_tasks(), key=lambda t: self.monitor.first_seen.get(t, now)
+        )
+
+        stream = io.StringIO()
+        stream.write(
+            f"{len(tasks)} tasks, loop lag {self.monitor.lag * 1000:.1f} ms, "
+            f"max {self.monitor.max_lag * 1000:.1f} ms\n"
+        )
+        for task in tasks:
+            age = now - self.monitor.first_seen.get(task, now)
+            stream.write(f"\n--- {task.get_name()} running for at least {age:.0f}s\n")
+            task.print_stack(limit=10, file=stream)
+        return self.write("tasks", stream.getvalue()), stream.getvalue()
+
+    def stop_memory(self) -> None:
+        tracemalloc.stop()
+        self._snapshot = None
+
+    def write(self, kind: str, text: str) -> Path:
+        path = self._path(kind, "txt")
+        path.write_text(text, encoding="utf-8")
+        return path
+
+    def _path(self, kind: str, suffix: str) -> Path:
+        directory = Path(settings.profile_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"{kind}-{datetime.now():%Y%m%d-%H%M%S-%f}.{suffix}"
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        # Leave out tracemalloc's own allocations
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+
+    def _toggle_cpu(self) -> None:
+        if not self.start_cpu():
+            self.stop_cpu()
+
+    def _dump(self) -> None:
+        path, _ = self.memory_diff()
+        logger.info(f"Memory diff written to {path}")
+        path, _ = self.task_stacks()
+        logger.info(f"Task stacks written to {path}")
+
+
+# Singleton instance
+profiler = Profiler()
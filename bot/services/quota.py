@@ -0,0 +1,75 @@
+import calendar
+import logging
+from datetime import datetime, timedelta, timezone
+
+from bot.database import ApiUsageRepository, async_session
+from bot.metrics import API_BUDGET_LIMIT, API_BUDGET_REJECTED, API_BUDGET_USED
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaBudget:
+    """Daily and monthly API call budget, counted in the database so replicas share it
+
+    Periods follow UTC calendar days and months. A limit of 0 disables it.
+    """
+
+    def __init__(self, api: str, daily_limit: int, monthly_limit: int):
+        self.api = api
+        self.daily_limit = daily_limit
+        self.monthly_limit = monthly_limit
+        self.used_today = 0
+        self.used_month = 0
+        API_BUDGET_LIMIT.labels(api, "day").set(daily_limit)
+        API_BUDGET_LIMIT.labels(api, "month").set(monthly_limit)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.used_today}/{self.daily_limit or '∞'} today, "
+            f"{self.used_month}/{self.monthly_limit or '∞'} this month"
+        )
+
+    async def try_spend(self) -> bool:
+        """Count one call, returning False if it would exceed the budget"""
+        now = datetime.now(timezone.utc)
+        day, month = f"{now:%Y-%m-%d}", f"{now:%Y-%m}"
+        try:
+            async with async_session() as session:
+                repo = ApiUsageRepository(session)
+                used = await repo.spend(
+                    self.api, {day: self.daily_limit, month: self.monthly_limit}
+                )
+        except Exception as e:
+            # Accounting problems must not stop the bot from getting data
+            logger.error(f"Failed to account {self.api} API call: {e}")
+            return True
+
+        if used is None:
+            API_BUDGET_REJECTED.labels(self.api).inc()
+            logger.warning(f"{self.api} API budget exhausted: {self}")
+            return False
+
+        self.used_today, self.used_month = used[day], used[month]
+        API_BUDGET_USED.labels(self.api, "day").set(self.used_today)
+        API_BUDGET_USED.labels(self.api, "month").set(self.used_month)
+        return True
+
+    def pacing_interval(self, consumers: int = 1) -> timedelta:
+        """Minimum time between calls of each consumer to last until the period ends"""
+        now = datetime.now(timezone.utc)
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        allowances = []
+        if self.daily_limit:
+            allowances.append(self.daily_limit - self.used_today)
+        if self.monthly_limit:
+            days_left = calendar.monthrange(now.year, now.month)[1] - now.day + 1
+            allowances.append((self.monthly_limit - self.used_month) / days_left)
+        if not allowances:
+            return timedelta(0)
+
+        # With nothing left today, wait for the daily reset
+        calls_left = min(allowances)
+        if calls_left < 1:
+            return midnight - now
+        return min((midnight - now) * consumers / calls_left, midnight - now)
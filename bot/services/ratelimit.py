@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Token bucket limiter shared by concurrent senders"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        # The lock keeps waiters in FIFO order so nobody starves
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def try_consume(self, tokens: float = 1.0) -> bool:
+        """Take tokens without waiting, False if there are not enough"""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return False
+
+        self._refill(now)
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+    def block_for(self, seconds: float) -> None:
+        """Stop handing out tokens, e.g. after Telegram flood control"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class ChatRateLimiter:
+    """Keeps a minimum interval between messages to the same chat"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_allowed: dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        next_allowed = self._next_allowed.get(chat_id, 0.0)
+        if next_allowed > now:
+            self._next_allowed[chat_id] = next_allowed + self.interval
+            await asyncio.sleep(next_allowed - now)
+        else:
+            self._next_allowed[chat_id] = now + self.interval
+
+    def block_for(self, chat_id: int, seconds: float) -> None:
+        self._next_allowed[chat_id] = max(
+            self._next_allowed.get(chat_id, 0.0), time.monotonic() + seconds
+        )
+
+    def cleanup(self) -> None:
+        """Forget chats whose interval has already passed"""
+        now = time.monotonic()
+        self._next_allowed = {
+            chat_id: ts for chat_id, ts in self._next_allowed.items() if ts > now
+        }
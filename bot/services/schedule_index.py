@@ -0,0 +1,139 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from bot.database import UserRepository, async_read_session
+from bot.services.leader import owns_chat
+
+logger = logging.getLogger(__name__)
+
+# updated_at is the writing transaction's start and the read replica lags, so a
+# change can show up with a timestamp older than the last one seen. Syncs look
+# back this far, re-applying a change is harmless.
+SYNC_OVERLAP = timedelta(minutes=2)
+
+# (minute of day, location, time chosen by the user)
+Entry = tuple[int, str, bool]
+
+
+class DailyScheduleIndex:
+    """In-memory index of daily subscribers by minute of day"""
+
+    def __init__(self):
+        # minute of day -> {telegram_id: location}
+        self._by_minute: dict[int, dict[int, str]] = defaultdict(dict)
+        self._minute_of: dict[int, int] = {}
+        self._flexible: set[int] = set()  # subscribers who kept the default time
+        self._pending: dict[int, Entry | None] | None = None
+        self._synced_until: datetime | None = None  # latest updated_at seen
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._minute_of)
+
+    async def load(self) -> int:
+        """(Re)build the index from the database, returning the subscriber count
+
+        Only users of this replica's shard are loaded.
+        """
+        # Updates made while the query runs are replayed on top of the snapshot
+        self._pending = {}
+        try:
+            async with async_read_session() as session:
+                repo = UserRepository(session)
+                synced_until = await repo.get_last_update()
+                rows = await repo.get_daily_schedule()
+
+            by_minute: dict[int, dict[int, str]] = defaultdict(dict)
+            minute_of: dict[int, int] = {}
+            flexible: set[int] = set()
+            for telegram_id, hour, minute, location, time_chosen in rows:
+                minute_of_day = hour * 60 + minute
+                by_minute[minute_of_day][telegram_id] = location
+                minute_of[telegram_id] = minute_of_day
+                if not time_chosen:
+                    flexible.add(telegram_id)
+
+            pending = self._pending
+            self._by_minute, self._minute_of, self._flexible = by_minute, minute_of, flexible
+            self._synced_until = synced_until
+        finally:
+            self._pending = None
+
+        for telegram_id, entry in pending.items():
+            self._set(telegram_id, entry)
+
+        self.loaded = True
+        return len(self)
+
+    async def sync(self) -> int:
+        """Apply settings changed since the last load or sync, returning their count
+
+        Picks up changes handled by other replicas within a minute, without
+        reading the whole schedule.
+        """
+        if self._synced_until is None:
+            return await self.load()
+
+        async with async_read_session() as session:
+            repo = UserRepository(session)
+            rows = await repo.get_schedule_changes(self._synced_until - SYNC_OVERLAP)
+
+        for telegram_id, enabled, hour, minute, location, time_chosen, updated_at in rows:
+            self._apply(
+                telegram_id, (hour * 60 + minute, location, time_chosen) if enabled else None
+            )
+            self._synced_until = max(self._synced_until, updated_at)
+        return len(rows)
+
+    def update(
+        self,
+        telegram_id: int,
+        enabled: bool,
+        hour: int,
+        minute: int,
+        location: str,
+        time_chosen: bool,
+    ) -> None:
+        if not owns_chat(telegram_id):
+            return
+
+        self._apply(
+            telegram_id, (hour * 60 + minute, location, time_chosen) if enabled else None
+        )
+
+    def get(self, hour: int, minute: int) -> dict[str, list[int]]:
+        """Return subscribers for the given time grouped by location"""
+        grouped: dict[str, list[int]] = defaultdict(list)
+        for telegram_id, location in self._by_minute.get(hour * 60 + minute, {}).items():
+            grouped[location].append(telegram_id)
+        return dict(grouped)
+
+    def time_chosen(self, telegram_id: int) -> bool:
+        """Whether the subscriber picked the time, the planner may delay the others"""
+        return telegram_id not in self._flexible
+
+    def _apply(self, telegram_id: int, entry: Entry | None) -> None:
+        if self._pending is not None:
+            self._pending[telegram_id] = entry
+        self._set(telegram_id, entry)
+
+    def _set(self, telegram_id: int, entry: Entry | None) -> None:
+        self._flexible.discard(telegram_id)
+        previous = self._minute_of.pop(telegram_id, None)
+        if previous is not None:
+            subscribers = self._by_minute[previous]
+            subscribers.pop(telegram_id, None)
+            if not subscribers:
+                del self._by_minute[previous]
+
+        if entry is not None:
+            minute_of_day, location, time_chosen = entry
+            self._by_minute[minute_of_day][telegram_id] = location
+            self._minute_of[telegram_id] = minute_of_day
+            if not time_chosen:
+                self._flexible.add(telegram_id)
+
+
+# Singleton instance
+schedule_index = DailyScheduleIndex()
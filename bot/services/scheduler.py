@@ -1,35 +1,39 @@
+import asyncio
 import logging
-from datetime import datetime
+from collections import Counter
+from collections.abc import Iterable
+from datetime import datetime, timedelta, timezone
 
 import pytz
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from bot.database import UserRepository, async_session
-from bot.services.iqair import iqair_service
+from bot.config import settings
+from bot.database import UserRepository, async_read_session, async_session
+from bot.metrics import JOB_USERS, observe_job
+from bot.services.alerts import ALERT_LEVELS, alert_level, decide_alert
+from bot.services.broadcast import OutgoingMessage
+from bot.services.delivery_planner import DeliveryPlanner
+from bot.services.history import history_service
+from bot.services.iqair import AirQualityData, iqair_service
+from bot.services.leader import LeaderElection
+from bot.services.outbox import NotificationOutbox
+from bot.services.schedule_index import schedule_index
 
 logger = logging.getLogger(__name__)
 
 ALMATY_TZ = pytz.timezone("Asia/Almaty")
 
 
-def get_greeting(hour: int) -> str:
-    """Return appropriate greeting based on hour"""
-    if 5 <= hour < 12:
-        return "🌅 Доброе утро!"
-    elif 12 <= hour < 18:
-        return "🌤 Добрый день!"
-    elif 18 <= hour < 23:
-        return "🌆 Добрый вечер!"
-    else:
-        return "🌙 Доброй ночи!"
-
-
 class NotificationScheduler:
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, outbox: NotificationOutbox):
         self.bot = bot
+        self.outbox = outbox
         self.scheduler = AsyncIOScheduler(timezone=ALMATY_TZ)
-        self._last_aqi: int | None = None
+        self.leader = LeaderElection(self._on_elected, self._on_demoted)
+        # Shards share the bot's Telegram rate limit
+        self.planner = DeliveryPlanner(settings.broadcast_rate_limit / settings.shard_count)
+        self._levels: dict[str, str] = {}  # location -> last processed alert level
 
     def start(self) -> None:
         # Check for daily notifications every minute
@@ -40,122 +44,205 @@ class NotificationScheduler:
             id="daily_notifications",
         )
 
-        # Check AQI for alerts every 15 minutes
+        # Check for new AQI measurements, IQAir is only called when one is due
         self.scheduler.add_job(
             self._check_aqi_alerts,
             "interval",
-            minutes=15,
+            minutes=settings.alerts_check_minutes,
             id="aqi_alerts",
         )
 
-        self.scheduler.start()
+        # Periodically rebuild the in-memory daily schedule with the database
+        self.scheduler.add_job(
+            self._resync_schedule_index,
+            "interval",
+            minutes=settings.schedule_resync_minutes,
+            id="schedule_index_resync",
+        )
+
+        # Other replicas only take updates in webhook mode, with polling every
+        # change goes through this process and updates the index directly
+        if settings.webhook_url:
+            self.scheduler.add_job(
+                self._sync_schedule_index,
+                "interval",
+                seconds=settings.schedule_sync_seconds,
+                id="schedule_index_sync",
+            )
+
+        # Maintenance is not per user, the first shard's leader takes care of it
+        if settings.shard_index == 0:
+            # Downsample AQI history once a day
+            self.scheduler.add_job(
+                history_service.apply_retention,
+                "cron",
+                hour=3,
+                minute=30,
+                id="history_retention",
+            )
+
+            # Drop delivered and failed outbox rows
+            self.scheduler.add_job(
+                self.outbox.purge,
+                "cron",
+                hour=3,
+                minute=45,
+                id="outbox_purge",
+            )
+
+        # Jobs only run while this replica holds the leader lock
+        self.scheduler.start(paused=True)
+        self.leader.start()
         logger.info("Notification scheduler started")
 
-    def stop(self) -> None:
+    async def stop(self) -> None:
+        await self.leader.stop()
         self.scheduler.shutdown()
         logger.info("Notification scheduler stopped")
 
-    async def _send_daily_notifications(self) -> None:
+    async def _on_elected(self) -> None:
+        # The previous leader may have seen changes this replica did not
+        await self._resync_schedule_index()
+        self.scheduler.resume()
+        # Only leaders send, so replicas don't multiply the bot's send rate
+        self.outbox.start()
+        logger.info("Notification scheduler resumed")
+
+    async def _on_demoted(self) -> None:
+        self.scheduler.pause()
+        await self.outbox.stop()
+        logger.info("Notification scheduler paused")
+
+    @observe_job("daily_notifications")
+    async def _send_daily_notifications(self, now: datetime | None = None) -> None:
         """Send daily notifications to users whose scheduled time matches current time"""
-        now = datetime.now(ALMATY_TZ)
+        now = now or datetime.now(ALMATY_TZ)
         current_hour = now.hour
         current_minute = now.minute
 
         logger.debug(f"Checking daily notifications for {current_hour:02d}:{current_minute:02d}")
 
-        async with async_session() as session:
-            repo = UserRepository(session)
-            users = await repo.get_users_for_daily_notification(current_hour, current_minute)
+        subscribers = schedule_index.get(current_hour, current_minute)
+        if not subscribers:
+            return
 
-            if not users:
-                return
+        # Fetch and render once per location
+        air_data_by_location = await self._fetch_air_quality(subscribers)
 
-            # Get current air quality
-            air_data = await iqair_service.get_air_quality()
+        messages = []
+        for location, telegram_ids in subscribers.items():
+            air_data = air_data_by_location.get(location)
             if not air_data:
-                logger.warning("Could not fetch air quality data for daily notifications")
-                return
-
-            message = air_data.format_message()
-
-            greeting = get_greeting(current_hour)
-            for user in users:
-                try:
-                    await self.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=f"<b>{greeting}</b>\n\n{message}",
-                        parse_mode="HTML",
-                    )
-                    logger.info(f"Sent daily notification to user {user.telegram_id}")
-                except Exception as e:
-                    logger.error(f"Failed to send notification to {user.telegram_id}: {e}")
+                logger.warning(f"Could not fetch air quality data for daily notifications: {location}")
+                continue
+
+            text = air_data.daily_message(current_hour)
+            messages.extend(
+                OutgoingMessage(chat_id=telegram_id, text=text, kind="daily")
+                for telegram_id in telegram_ids
+            )
+
+        JOB_USERS.labels("daily_notifications").set(len(messages))
+
+        # Users who picked the time get the earliest slots, the rest can wait
+        start = datetime.now(timezone.utc) + timedelta(seconds=settings.outbox_coalesce_seconds)
+        strict = [m for m in messages if schedule_index.time_chosen(m.chat_id)]
+        flexible = [m for m in messages if not schedule_index.time_chosen(m.chat_id)]
+        curve = Counter(self.planner.plan(strict, start, strict=True))
+        curve.update(self.planner.plan(flexible, start, strict=False))
+
+        planned = ", ".join(f"{m} {n}" for m, n in sorted(curve.items()))
+
+        queued = await self.outbox.enqueue(messages)
+        logger.info(
+            f"Queued {queued} daily notifications for {current_hour:02d}:{current_minute:02d}, "
+            f"planned per minute: {planned or 'none'}"
+        )
 
+    async def _sync_schedule_index(self) -> None:
+        """Apply settings changed through other replicas since the last sync"""
+        changed = await schedule_index.sync()
+        logger.debug(f"Daily schedule index synced {changed} changed users")
+
+    async def _resync_schedule_index(self) -> None:
+        """Rebuild the daily schedule index to pick up changes made elsewhere"""
+        count = await schedule_index.load()
+        logger.debug(f"Daily schedule index resynced: {count} subscribers")
+
+    @observe_job("aqi_alerts")
     async def _check_aqi_alerts(self) -> None:
-        """Check AQI and send alerts if threshold exceeded or quality improved"""
-        air_data = await iqair_service.get_air_quality(force_refresh=True)
-        if not air_data:
-            logger.warning("Could not fetch air quality data for alerts")
+        """Send alerts to users whose alert level bucket was crossed by a new measurement"""
+        # Which locations to poll may lag behind on the replica, a new subscriber
+        # is picked up on a later check
+        async with async_read_session() as session:
+            repo = UserRepository(session)
+            alert_locations = set(await repo.get_alert_locations())
+            locations = set(alert_locations)
+            # Every shard fetches the same readings, the first one also polls the
+            # other shards' and daily-only locations and stores the history of all
+            if settings.shard_index == 0:
+                locations.update(await repo.get_subscribed_locations())
+
+        readings = await iqair_service.poll(locations)
+        if not readings:
+            logger.debug("No new AQI measurements, skipping alerts")
             return
 
-        current_aqi = air_data.aqi
-        logger.debug(f"Current AQI: {current_aqi}")
+        changed: dict[str, AirQualityData] = {}
+        for location, air_data in readings.items():
+            if settings.shard_index == 0:
+                history_service.record(air_data)
+            logger.debug(f"Current AQI in {location}: {air_data.aqi}")
+
+            # After a transition every user's level lies on the AQI's side of their
+            # threshold, so nobody crosses one while the location's level stays the
+            # same. Unknown after a restart or failover.
+            level = alert_level(air_data.aqi)
+            if location in alert_locations and self._levels.get(location) != level:
+                changed[location] = air_data
+
+        await history_service.flush()
 
+        if not changed:
+            JOB_USERS.labels("aqi_alerts").set(0)
+            return
+
+        # Recipients are read on the primary and locked, and their alerts and new
+        # levels committed together, so a lagging replica or a crash in between
+        # neither loses nor repeats alerts
+        messages = []
         async with async_session() as session:
             repo = UserRepository(session)
-            users = await repo.get_users_for_alert()
-
-            for user in users:
-                await self._process_user_alert(user, current_aqi, air_data, repo)
-
-        self._last_aqi = current_aqi
-
-    async def _process_user_alert(self, user, current_aqi: int, air_data, repo: UserRepository) -> None:
-        """Process alert for a single user"""
-        threshold = user.alert_threshold
-        last_level = user.last_aqi_level
-
-        # Determine current level category
-        if current_aqi >= 301:
-            current_level = "hazardous"
-        elif current_aqi >= 201:
-            current_level = "very_unhealthy"
-        elif current_aqi >= 151:
-            current_level = "unhealthy"
-        elif current_aqi >= 101:
-            current_level = "unhealthy_sensitive"
-        else:
-            current_level = "good"
-
-        # Check if we should send an alert
-        should_alert = False
-        alert_type = None
-
-        if current_aqi >= threshold:
-            # AQI exceeded threshold
-            if last_level != current_level:
-                should_alert = True
-                alert_type = "warning"
-        elif last_level in ("unhealthy_sensitive", "unhealthy", "very_unhealthy", "hazardous"):
-            # AQI improved from bad to good
-            if current_aqi < threshold:
-                should_alert = True
-                alert_type = "improved"
-
-        if should_alert:
-            try:
-                if alert_type == "warning":
-                    prefix = "⚠️ <b>Внимание! Качество воздуха ухудшилось</b>\n\n"
-                else:
-                    prefix = "✅ <b>Качество воздуха улучшилось!</b>\n\n"
-
-                await self.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=f"{prefix}{air_data.format_message()}",
-                    parse_mode="HTML",
-                )
-                logger.info(f"Sent {alert_type} alert to user {user.telegram_id}")
-            except Exception as e:
-                logger.error(f"Failed to send alert to {user.telegram_id}: {e}")
-
-        # Update user's last AQI level
-        await repo.update_last_aqi_level(user.telegram_id, current_level)
+            for location, air_data in changed.items():
+                level = alert_level(air_data.aqi)
+                recipients = await repo.get_alert_recipients(location, air_data.aqi, ALERT_LEVELS)
+                for telegram_id, threshold, last_level in recipients:
+                    alert_type = decide_alert(air_data.aqi, threshold, last_level)
+                    if alert_type:
+                        messages.append(
+                            OutgoingMessage(
+                                chat_id=telegram_id,
+                                text=air_data.alert_message(alert_type),
+                                kind=alert_type,
+                            )
+                        )
+                updated = await repo.set_last_aqi_level([row[0] for row in recipients], level)
+                logger.info(f"AQI level in {location} is now {level}: {updated} alerts")
+            queued = await self.outbox.enqueue(messages, session)
+            await session.commit()
+
+        JOB_USERS.labels("aqi_alerts").set(len(messages))
+        self._levels.update(
+            (location, alert_level(air_data.aqi)) for location, air_data in changed.items()
+        )
+        self.outbox.wake()
+        if queued:
+            logger.info(f"Queued {queued} AQI alerts")
+
+    async def _fetch_air_quality(self, locations: Iterable[str]) -> dict[str, AirQualityData]:
+        """Fetch air quality for every location concurrently"""
+        locations = list(locations)
+        results = await asyncio.gather(
+            *(iqair_service.get_air_quality(location) for location in locations)
+        )
+        return {location: air_data for location, air_data in zip(locations, results) if air_data}
@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+
+from bot.config import settings
+from bot.database import User, UserRepository, async_session
+from bot.metrics import USER_CACHE_HIT, USER_CACHE_MISS
+from bot.tracing import span
+
+
+@dataclass(frozen=True)
+class UserSettings:
+    """Notification settings of a user as shown and edited by the handlers"""
+
+    telegram_id: int
+    location: str
+    daily_enabled: bool
+    daily_hour: int
+    daily_minute: int
+    daily_time_chosen: bool
+    alert_enabled: bool
+    alert_threshold: int
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSettings":
+        return cls(**{f.name: getattr(user, f.name) for f in fields(cls)})
+
+
+class UserSettingsCache:
+    """Read-through LRU cache of user settings in front of UserRepository
+
+    Entries expire after ``user_cache_ttl`` so changes made by other replicas
+    show up eventually. Writes go through ``save`` and update the cache.
+    last_aqi_level is maintained by the scheduler in bulk and is not cached.
+    """
+
+    def __init__(self):
+        # telegram_id -> (settings or None for unknown users, loaded at)
+        self._cache: OrderedDict[int, tuple[UserSettings | None, float]] = OrderedDict()
+        self._writes = 0
+
+    async def get(self, telegram_id: int) -> UserSettings | None:
+        entry = self._cache.get(telegram_id)
+        if entry is not None and time.monotonic() - entry[1] < settings.user_cache_ttl:
+            USER_CACHE_HIT.inc()
+            self._cache.move_to_end(telegram_id)
+            return entry[0]
+        USER_CACHE_MISS.inc()
+
+        writes = self._writes
+        with span("db user.get"):
+            async with async_session() as session:
+                repo = UserRepository(session)
+                user = await repo.get_by_telegram_id(telegram_id)
+
+        user_settings = UserSettings.from_user(user) if user else None
+        # Don't overwrite a save that finished while the query was running
+        if writes == self._writes:
+            self._put(telegram_id, user_settings)
+        return user_settings
+
+    async def get_or_create(self, telegram_id: int) -> UserSettings:
+        user_settings = await self.get(telegram_id)
+        if user_settings is None:
+            user_settings = await self.save(telegram_id)
+        return user_settings
+
+    async def save(self, telegram_id: int, **values) -> UserSettings:
+        """Create or update the user in one round-trip and cache the result"""
+        self._writes += 1
+        with span("db user.save"):
+            async with async_session() as session:
+                repo = UserRepository(session)
+                user = await repo.save(telegram_id, **values)
+
+        user_settings = UserSettings.from_user(user)
+        self._put(telegram_id, user_settings)
+        return user_settings
+
+    def _put(self, telegram_id: int, user_settings: UserSettings | None) -> None:
+        self._cache[telegram_id] = (user_settings, time.monotonic())
+        self._cache.move_to_end(telegram_id)
+        while len(self._cache) > settings.user_cache_size:
+            self._cache.popitem(last=False)
+
+
+# Singleton instance
+user_settings = UserSettingsCache()
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import random
+import secrets
+import time
+from collections import deque
+from collections.abc import Coroutine, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import aiohttp
+
+from bot.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "almaty-air"
+
+
+@dataclass
+class Span:
+    """A timed stage of an update, ids and timestamps follow Zipkin"""
+
+    trace_id: str
+    name: str
+    parent_id: str | None = None
+    tags: dict[str, str] = field(default_factory=dict)
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    children: list["Span"] = field(default_factory=list)
+    finished: bool = False
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def child(self, name: str, tags: dict[str, str]) -> "Span":
+        span = Span(self.trace_id, name, self.span_id, tags)
+        self.children.append(span)
+        return span
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._started
+        self.finished = True
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_zipkin(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.started_at * 1_000_000),
+            "duration": max(int(self.duration * 1_000_000), 1),
+            "localEndpoint": {"serviceName": SERVICE_NAME},
+            "tags": self.tags,
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        return span
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace(name: str, **tags: object) -> Iterator[Span]:
+    """Start a trace for one update, slow ones are logged with all their spans"""
+    root = Span(secrets.token_hex(16), name, tags={k: str(v) for k, v in tags.items()})
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.tags["error"] = type(e).__name__
+        raise
+    finally:
+        root.finish()
+        _current_span.reset(token)
+
+        slow = root.duration >= settings.trace_slow_threshold
+        if slow:
+            log_slow_trace(root)
+        if slow or random.random() < settings.trace_sample_rate:
+            trace_exporter.export(root)
+
+
+@contextmanager
+def span(name: str, **tags: object) -> Iterator[Span | None]:
+    """Time a stage of the current trace, does nothing outside of one
+
+    A task that outlives the span it was started in has no trace either, the
+    trace may already be logged or exported.
+    """
+    parent = _current_span.get()
+    if parent is None or parent.finished:
+        yield None
+        return
+
+    child = parent.child(name, {k: str(v) for k, v in tags.items()})
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.tags["error"] = type(e).__name__
+        raise
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+
+def detached_task(coro: Coroutine) -> asyncio.Task:
+    """Start a background task outside of the current trace
+
+    Tasks copy the caller's context, without this their spans would join an
+    update's trace that has finished by the time they run.
+    """
+    context = copy_context()
+    context.run(_current_span.set, None)
+    return asyncio.create_task(coro, context=context)
+
+
+def log_slow_trace(root: Span) -> None:
+    entry = {
+        "trace_id": root.trace_id,
+        "name": root.name,
+        "duration_ms": round(root.duration * 1000, 1),
+        "tags": root.tags,
+        "spans": [
+            {
+                "name": span.name,
+                "offset_ms": round((span.started_at - root.started_at) * 1000, 1),
+                "duration_ms": round(span.duration * 1000, 1),
+                **({"tags": span.tags} if span.tags else {}),
+            }
+            for span in root.walk()
+            if span is not root
+        ],
+    }
+    logger.warning(f"Slow update: {json.dumps(entry, ensure_ascii=False)}")
+
+
+class TraceExporter:
+    """Batches finished traces as Zipkin v2 JSON to a collector and/or a file
+
+    Disabled unless ``trace_export_url`` or ``trace_export_file`` is set. Spans
+    wait in a bounded buffer, the oldest are dropped if the collector is down.
+    """
+
+    def __init__(self):
+        self._spans: deque[dict] = deque(maxlen=settings.trace_export_buffer)
+        self._task: asyncio.Task | None = None
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.trace_export_url or settings.trace_export_file)
+
+    def export(self, root: Span) -> None:
+        if self.enabled:
+            self._spans.extend(span.to_zipkin() for span in root.walk())
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Trace export started")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self.flush()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def flush(self) -> None:
+        if not self._spans:
+            return
+        batch = list(self._spans)
+        self._spans.clear()
+
+        if settings.trace_export_file:
+            line = json.dumps(batch, ensure_ascii=False) + "\n"
+            await asyncio.to_thread(self._append, Path(settings.trace_export_file), line)
+
+        if settings.trace_export_url:
+            if self._session is None:
+                self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+            async with self._session.post(settings.trace_export_url, json=batch) as response:
+                if response.status >= 400:
+                    logger.warning(f"Trace collector answered {response.status}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.trace_export_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Failed to export traces: {e}")
+
+    @staticmethod
+    def _append(path: Path, line: str) -> None:
+        with path.open("a", encoding="utf-8") as f:
+            f.write(line)
+
+
+# Singleton instance
+trace_exporter = TraceExporter()
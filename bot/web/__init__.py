@@ -0,0 +1,13 @@
+from .health import readiness, setup_health
+from .metrics import setup_metrics
+from .server import start_web_server
+from .webhook import UpdateQueue, run_webhook
+
+__all__ = [
+    "UpdateQueue",
+    "readiness",
+    "run_webhook",
+    "setup_health",
+    "setup_metrics",
+    "start_web_server",
+]
@@ -0,0 +1,69 @@
+import logging
+import time
+
+from aiohttp import web
+
+from bot.metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Tracks startup stages, the bot is ready once all of them are done"""
+
+    STAGES = ("database", "iqair", "updates")
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._done: set[str] = set()
+        self.first_response_logged = False
+
+    @property
+    def pending(self) -> list[str]:
+        return [stage for stage in self.STAGES if stage not in self._done]
+
+    @property
+    def ready(self) -> bool:
+        return not self.pending
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def mark(self, stage: str) -> None:
+        if stage in self._done:
+            return
+        self._done.add(stage)
+        STARTUP_SECONDS.labels(stage).set(self.elapsed())
+        logger.info(f"Startup stage {stage} done after {self.elapsed():.2f}s")
+
+        if self.ready:
+            STARTUP_SECONDS.labels("ready").set(self.elapsed())
+            logger.info(f"Bot is ready after {self.elapsed():.2f}s")
+
+    def mark_first_response(self) -> None:
+        if self.first_response_logged:
+            return
+        self.first_response_logged = True
+        STARTUP_SECONDS.labels("first_response").set(self.elapsed())
+        logger.info(f"First update handled {self.elapsed():.2f}s after start")
+
+
+async def handle_healthz(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+async def handle_readyz(request: web.Request) -> web.Response:
+    if not readiness.ready:
+        return web.json_response(
+            {"status": "starting", "pending": readiness.pending}, status=503
+        )
+    return web.json_response({"status": "ready"})
+
+
+def setup_health(app: web.Application) -> None:
+    app.router.add_get("/healthz", handle_healthz)
+    app.router.add_get("/readyz", handle_readyz)
+
+
+# Singleton instance, created at import so startup time is measured from process start
+readiness = Readiness()
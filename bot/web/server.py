@@ -0,0 +1,16 @@
+import logging
+
+from aiohttp import web
+
+from bot.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def start_web_server(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.web_host, settings.web_port)
+    await site.start()
+    logger.info(f"Web server listening on {settings.web_host}:{settings.web_port}")
+    return runner
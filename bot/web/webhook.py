@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import signal
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from bot.config import settings
+
+from .health import readiness
+from .server import start_web_server
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateQueue:
+    """Bounded queue of raw webhook updates drained by a pool of workers"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(settings.update_queue_size)
+        self._workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(settings.update_workers)
+        ]
+        logger.info(f"Update queue started with {settings.update_workers} workers")
+
+    async def stop(self) -> None:
+        # Let already acknowledged updates finish before shutting down
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=10)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._queue.qsize()} queued updates on shutdown")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def put(self, update: dict[str, Any]) -> bool:
+        try:
+            self._queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _worker(self) -> None:
+        while True:
+            raw_update = await self._queue.get()
+            try:
+                update = Update.model_validate(raw_update, context={"bot": self.bot})
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception as e:
+                logger.exception(f"Failed to process update: {e}")
+            finally:
+                self._queue.task_done()
+
+
+def setup_webhook(app: web.Application, queue: UpdateQueue) -> None:
+    async def handle_update(request: web.Request) -> web.Response:
+        if settings.webhook_secret and request.headers.get(SECRET_HEADER) != settings.webhook_secret:
+            return web.Response(status=401)
+
+        try:
+            raw_update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        # Acknowledge right away; a full queue makes Telegram redeliver later
+        if not queue.put(raw_update):
+            logger.warning("Update queue is full, rejecting update")
+            return web.Response(status=503)
+        return web.Response()
+
+    app.router.add_post(settings.webhook_path, handle_update)
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, app: web.Application) -> None:
+    """Serve updates through a webhook until the process is stopped"""
+    queue = UpdateQueue(dispatcher, bot)
+    setup_webhook(app, queue)
+
+    await dispatcher.emit_startup(bot=bot)
+    queue.start()
+    runner = await start_web_server(app)
+    await bot.set_webhook(
+        url=f"{settings.webhook_url.rstrip('/')}{settings.webhook_path}",
+        secret_token=settings.webhook_secret,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+    readiness.mark("updates")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await queue.stop()
+        await dispatcher.emit_shutdown(bot=bot)
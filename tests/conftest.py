@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# Settings are read on import, so this must run before bot modules are imported
+os.environ.setdefault("BOT_TOKEN", "42:test")
+os.environ.setdefault("IQAIR_API_KEY", "test")
+os.environ.setdefault("POSTGRES_PASSWORD", "test")
+os.environ["DATABASE_DSN"] = (
+    f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='almaty_air_test_')}/test.db"
+)
@@ -0,0 +1,112 @@
+import asyncio
+import itertools
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+from bot.database import User, UserRepository, async_session, init_db
+from bot.database.repository import as_utc, engine
+from bot.services.alerts import ALERT_LEVELS, alert_level, decide_alert
+
+THRESHOLDS = [101, 151, 201, 301]
+LAST_LEVELS = [None, "moderate", "good", *(level for _, level in ALERT_LEVELS)]
+SETTINGS_SAVED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+AQIS = [0, 50, 100, 101, 120, 150, 151, 160, 200, 201, 250, 300, 301, 400]
+
+
+@pytest.mark.parametrize(
+    ("aqi", "threshold", "last_level", "expected"),
+    [
+        (120, 101, "good", "warning"),
+        (120, 101, None, "warning"),
+        (120, 101, "unhealthy_sensitive", None),
+        (80, 101, "unhealthy_sensitive", "improved"),
+        (80, 151, "unhealthy_sensitive", None),
+        # Getting worse below the threshold is not an improvement
+        (160, 301, "unhealthy_sensitive", None),
+        (250, 301, "unhealthy", None),
+        # Getting better above the threshold is not a warning
+        (180, 101, "very_unhealthy", None),
+        (140, 151, "hazardous", "improved"),
+    ],
+)
+def test_decide_alert(aqi, threshold, last_level, expected):
+    assert decide_alert(aqi, threshold, last_level) == expected
+
+
+def test_recipient_query_matches_decide_alert():
+    """get_alert_recipients selects exactly the users decide_alert alerts"""
+
+    async def run() -> None:
+        await init_db()
+        combos = list(itertools.product(THRESHOLDS, LAST_LEVELS))
+        users = {
+            1000 + i: (threshold, last_level) for i, (threshold, last_level) in enumerate(combos)
+        }
+        async with async_session() as session:
+            session.add_all(
+                User(
+                    telegram_id=telegram_id,
+                    location="almaty",
+                    alert_enabled=True,
+                    alert_threshold=threshold,
+                    last_aqi_level=last_level,
+                )
+                for telegram_id, (threshold, last_level) in users.items()
+            )
+            await session.commit()
+
+            repo = UserRepository(session)
+            for aqi in AQIS:
+                selected = {
+                    row[0] for row in await repo.get_alert_recipients("almaty", aqi, ALERT_LEVELS)
+                }
+                expected = {
+                    telegram_id
+                    for telegram_id, (threshold, last_level) in users.items()
+                    if decide_alert(aqi, threshold, last_level)
+                }
+                assert selected == expected, f"AQI {aqi} ({alert_level(aqi)})"
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_level_update_only_touches_alerted_users():
+    async def run() -> None:
+        await init_db()
+        async with async_session() as session:
+            session.add_all(
+                User(
+                    telegram_id=telegram_id,
+                    location="shymkent",
+                    alert_enabled=True,
+                    alert_threshold=threshold,
+                    last_aqi_level="moderate",
+                    updated_at=SETTINGS_SAVED_AT,
+                )
+                for telegram_id, threshold in ((2001, 101), (2002, 151), (2003, 201))
+            )
+            await session.commit()
+
+            repo = UserRepository(session)
+            recipients = await repo.get_alert_recipients("shymkent", 160, ALERT_LEVELS)
+            assert sorted(row[0] for row in recipients) == [2001, 2002]
+
+            updated = await repo.set_last_aqi_level([row[0] for row in recipients], "unhealthy")
+            await session.commit()
+            assert updated == 2
+
+            session.expire_all()
+            users = {
+                user.telegram_id: user
+                for user in await session.scalars(select(User).where(User.location == "shymkent"))
+            }
+            assert users[2001].last_aqi_level == users[2002].last_aqi_level == "unhealthy"
+            assert users[2003].last_aqi_level == "moderate"
+            # Alert bookkeeping is not a settings change for the schedule sync
+            assert {as_utc(user.updated_at) for user in users.values()} == {SETTINGS_SAVED_AT}
+        await engine.dispose()
+
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from bot.config import settings
+from bot.services.broadcast import OutgoingMessage
+from bot.services.delivery_planner import DeliveryPlanner
+
+START = datetime(2026, 3, 1, 3, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def planner_settings(monkeypatch):
+    monkeypatch.setattr(settings, "daily_strict_window", 5)
+    monkeypatch.setattr(settings, "daily_spread_seconds", 20)
+    monkeypatch.setattr(settings, "daily_flexible_share", 0.5)
+
+
+def make_messages(count: int, first_id: int = 1) -> list[OutgoingMessage]:
+    return [
+        OutgoingMessage(chat_id=first_id + i, text="daily", kind="daily") for i in range(count)
+    ]
+
+
+def per_second(messages: list[OutgoingMessage]) -> Counter:
+    return Counter(int((m.send_at - START).total_seconds()) for m in messages)
+
+
+def test_strict_batch_fills_earliest_seconds_at_capacity():
+    planner = DeliveryPlanner(rate=10)
+    messages = make_messages(25)
+
+    curve = planner.plan(messages, START, strict=True)
+
+    assert per_second(messages) == {0: 10, 1: 10, 2: 5}
+    assert sum(curve.values()) == 25
+
+
+def test_flexible_batch_keeps_to_its_share_of_capacity():
+    planner = DeliveryPlanner(rate=10)
+    messages = make_messages(25)
+
+    planner.plan(messages, START, strict=False)
+
+    assert per_second(messages) == {0: 5, 1: 5, 2: 5, 3: 5, 4: 5}
+
+
+def test_strict_batch_finds_room_after_flexible_one():
+    planner = DeliveryPlanner(rate=10)
+    flexible = make_messages(100)
+    planner.plan(flexible, START, strict=False)
+    # The next minute's users who picked their time arrive while the spread is in progress
+    strict = make_messages(12, first_id=1000)
+    planner.plan(strict, START + timedelta(seconds=2), strict=True)
+
+    assert per_second(strict) == {2: 5, 3: 5, 4: 2}
+    load = per_second(flexible) + per_second(strict)
+    assert max(load.values()) <= planner.capacity
+
+
+def test_overflow_spreads_evenly_over_the_window():
+    planner = DeliveryPlanner(rate=10)
+    messages = make_messages(70)
+
+    planner.plan(messages, START, strict=True)
+
+    # 50 fit the five seconds of the window, the other 20 are spread over it
+    assert per_second(messages) == {0: 14, 1: 14, 2: 14, 3: 14, 4: 14}
+
+
+def test_past_seconds_are_pruned():
+    planner = DeliveryPlanner(rate=10)
+    planner.plan(make_messages(30), START, strict=True)
+
+    later = make_messages(10)
+    planner.plan(later, START + timedelta(seconds=60), strict=True)
+
+    assert per_second(later) == {60: 10}
+    assert min(planner._load) == int(START.timestamp()) + 60
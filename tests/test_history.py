@@ -0,0 +1,34 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bot.database import AqiHistoryRepository, AqiReading, async_session, init_db
+from bot.database.repository import engine, hour_bucket
+
+
+def test_stored_readings_are_not_counted_twice():
+    async def run() -> None:
+        await init_db()
+        measured_at = datetime(2026, 1, 10, 5, tzinfo=timezone.utc)
+
+        def readings(*aqis: int) -> list[AqiReading]:
+            return [
+                AqiReading(
+                    location="almaty",
+                    aqi=aqi,
+                    main_pollutant="p2",
+                    measured_at=measured_at + timedelta(minutes=10 * i),
+                )
+                for i, aqi in enumerate(aqis)
+            ]
+
+        async with async_session() as session:
+            repo = AqiHistoryRepository(session)
+            assert await repo.add_readings(readings(100, 120)) == 2
+            # Retried after a lost commit, with one reading measured since
+            assert await repo.add_readings(readings(100, 120, 140)) == 1
+
+            [hour] = await repo.get_hourly("almaty", hour_bucket(measured_at))
+            assert (hour.samples, hour.aqi_sum, hour.aqi_max) == (3, 360, 140)
+        await engine.dispose()
+
+    asyncio.run(run())
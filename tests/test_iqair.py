@@ -0,0 +1,21 @@
+import asyncio
+
+from bot.services.iqair import IQAirService
+
+
+def test_exhausted_budget_is_not_rechecked_on_every_request():
+    async def run() -> None:
+        service = IQAirService()
+        checks = 0
+
+        async def try_spend() -> bool:
+            nonlocal checks
+            checks += 1
+            return False
+
+        service.budget.try_spend = try_spend
+        assert await service.get_air_quality("almaty") is None
+        assert await service.get_air_quality("almaty") is None
+        assert checks == 1
+
+    asyncio.run(run())
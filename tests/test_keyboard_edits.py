@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.config import settings
+from bot.services.keyboard_edits import KeyboardEditDebouncer
+
+
+class FakeMessage:
+    def __init__(self, latency: float = 0.0):
+        self.chat = SimpleNamespace(id=1)
+        self.message_id = 10
+        self.reply_markup = None
+        self.latency = latency
+        self.edits: list[str] = []
+
+    async def edit_reply_markup(self, reply_markup: InlineKeyboardMarkup) -> None:
+        await asyncio.sleep(self.latency)
+        self.edits.append(reply_markup.inline_keyboard[0][0].text)
+
+
+def markup(text: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=text)]]
+    )
+
+
+def test_edit_is_sent_once_presses_pause(monkeypatch):
+    monkeypatch.setattr(settings, "keyboard_edit_debounce", 0.05)
+
+    async def run() -> None:
+        debouncer, message = KeyboardEditDebouncer(), FakeMessage()
+        # Presses keep coming for longer than the debounce delay
+        for i in range(5):
+            debouncer.edit(message, markup(str(i)))
+            await asyncio.sleep(0.03)
+        assert message.edits == []
+
+        await asyncio.sleep(0.1)
+        assert message.edits == ["4"]
+
+    asyncio.run(run())
+
+
+def test_press_during_an_edit_in_flight_is_sent_after_it(monkeypatch):
+    monkeypatch.setattr(settings, "keyboard_edit_debounce", 0.02)
+
+    async def run() -> None:
+        debouncer, message = KeyboardEditDebouncer(), FakeMessage(latency=0.05)
+        debouncer.edit(message, markup("1"))
+        await asyncio.sleep(0.03)
+        debouncer.edit(message, markup("2"))
+
+        await asyncio.sleep(0.2)
+        assert message.edits == ["1", "2"]
+
+    asyncio.run(run())
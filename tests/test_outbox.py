@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from bot.config import settings
+from bot.database import OutboxMessage, OutboxRepository, async_session, init_db
+from bot.database.repository import engine
+from bot.services.broadcast import DeliveryReport, OutgoingMessage
+from bot.services.outbox import NotificationOutbox, coalesce
+
+
+class FakeBroadcaster:
+    """Records deliveries instead of calling Telegram, optionally failing all of them"""
+
+    def __init__(self, error: str | None = None):
+        self.error = error
+        self.sent: list[OutgoingMessage] = []
+
+    async def broadcast(self, messages) -> DeliveryReport:
+        messages = list(messages)
+        report = DeliveryReport(total=len(messages))
+        for message in messages:
+            if self.error:
+                message.error = self.error
+                report.failed += 1
+                report.retryable.append(message)
+            else:
+                self.sent.append(message)
+                report.sent += 1
+        return report
+
+
+def run_with_outbox(test) -> None:
+    async def run() -> None:
+        await init_db()
+        async with async_session() as session:
+            await session.execute(delete(OutboxMessage))
+            await session.commit()
+        try:
+            await test()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+async def stored() -> dict[int, OutboxMessage]:
+    async with async_session() as session:
+        return {row.id: row for row in await session.scalars(select(OutboxMessage))}
+
+
+def due_now(chat_id: int, kind: str) -> OutgoingMessage:
+    return OutgoingMessage(
+        chat_id=chat_id, text=kind, kind=kind, send_at=datetime.now(timezone.utc)
+    )
+
+
+def test_claimed_messages_are_hidden_until_the_lease_expires():
+    async def test() -> None:
+        outbox = NotificationOutbox(bot=None)
+        await outbox.enqueue([due_now(1, "message")])
+        lease = timedelta(seconds=0.5)
+
+        async with async_session() as session:
+            repo = OutboxRepository(session)
+            [claimed] = await repo.claim(10, lease)
+            # Another worker sees nothing while the lease holds
+            assert await repo.claim(10, lease) == []
+
+            await asyncio.sleep(0.6)
+            # The first worker died, the row is claimed again
+            [reclaimed] = await repo.claim(10, lease)
+            assert reclaimed.id == claimed.id
+
+        [row] = (await stored()).values()
+        assert (row.status, row.attempts) == ("pending", 2)
+
+    run_with_outbox(test)
+
+
+def test_retries_end_in_failed_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(settings, "outbox_max_attempts", 2)
+    monkeypatch.setattr(settings, "outbox_retry_base_seconds", 0)
+
+    async def test() -> None:
+        outbox = NotificationOutbox(bot=None)
+        outbox.broadcaster = FakeBroadcaster(error="Telegram is down")
+        await outbox.enqueue([due_now(1, "message")])
+
+        assert await outbox.process_batch() == 1
+        [row] = (await stored()).values()
+        assert (row.status, row.attempts) == ("pending", 1)
+
+        assert await outbox.process_batch() == 1
+        [row] = (await stored()).values()
+        assert (row.status, row.attempts, row.last_error) == ("failed", 2, "Telegram is down")
+
+        assert await outbox.process_batch() == 0
+
+    run_with_outbox(test)
+
+
+def test_notifications_to_one_chat_are_merged_into_the_alert():
+    async def test() -> None:
+        outbox = NotificationOutbox(bot=None)
+        outbox.broadcaster = FakeBroadcaster()
+        daily = due_now(1, "daily")
+        # Queued later and not due yet, still claimed along with the daily one
+        warning = OutgoingMessage(
+            chat_id=1,
+            text="warning",
+            kind="warning",
+            send_at=datetime.now(timezone.utc) + timedelta(minutes=5),
+        )
+        await outbox.enqueue([daily, warning, due_now(2, "daily")])
+
+        assert await outbox.process_batch() == 3
+        assert sorted((m.chat_id, m.kind) for m in outbox.broadcaster.sent) == [
+            (1, "warning"),
+            (2, "daily"),
+        ]
+        statuses = sorted((row.chat_id, row.kind, row.status) for row in (await stored()).values())
+        assert statuses == [(1, "daily", "merged"), (1, "warning", "sent"), (2, "daily", "sent")]
+
+    run_with_outbox(test)
+
+
+def test_coalesce_keeps_the_latest_of_equal_kinds():
+    rows = [
+        OutboxMessage(id=1, chat_id=1, kind="warning", text="old"),
+        OutboxMessage(id=2, chat_id=1, kind="improved", text="new"),
+        OutboxMessage(id=3, chat_id=1, kind="message", text="other"),
+    ]
+    deliver, merged = coalesce(rows)
+    assert sorted(row.id for row in deliver) == [2, 3]
+    assert [row.id for row in merged] == [1]
@@ -0,0 +1,52 @@
+import asyncio
+
+from bot.database import UserRepository, async_session, init_db
+from bot.database.repository import engine
+from bot.services.schedule_index import DailyScheduleIndex
+
+
+def test_sync_picks_up_changes_from_other_replicas():
+    async def run() -> None:
+        await init_db()
+        async with async_session() as session:
+            repo = UserRepository(session)
+            await repo.save(5001, daily_hour=9, daily_minute=0)
+            await repo.save(5002, daily_hour=9, daily_minute=0, location="astana")
+
+        index = DailyScheduleIndex()
+        await index.load()
+        assert sorted(index.get(9, 0)["almaty"]) == [5001]
+
+        # Saved by another replica, this index never saw update() calls
+        async with async_session() as session:
+            repo = UserRepository(session)
+            await repo.save(5001, daily_hour=10, daily_minute=30, daily_time_chosen=True)
+            await repo.save(5002, daily_enabled=False)
+            await repo.save(5003, daily_hour=10, daily_minute=30)
+
+        assert await index.sync() >= 3
+        assert index.get(9, 0) == {}
+        assert sorted(index.get(10, 30)["almaty"]) == [5001, 5003]
+        assert index.time_chosen(5001)
+        assert not index.time_chosen(5003)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_alert_level_changes_are_not_schedule_changes():
+    async def run() -> None:
+        await init_db()
+        async with async_session() as session:
+            repo = UserRepository(session)
+            await repo.save(5101, location="shymkent", alert_threshold=101)
+            since = await repo.get_last_update()
+
+            await asyncio.sleep(1.1)  # SQLite timestamps have second precision
+            await repo.set_last_aqi_level([5101], "unhealthy")
+            await session.commit()
+
+            assert await repo.get_schedule_changes(since) == []
+        await engine.dispose()
+
+    asyncio.run(run())
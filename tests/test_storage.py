@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiogram.fsm.storage.base import StorageKey
+
+from bot.config import settings
+from bot.database import DatabaseStorage, init_db
+from bot.database import storage as storage_module
+from bot.database.repository import engine
+
+
+def make_key(chat_id: int) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=chat_id, user_id=chat_id)
+
+
+async def stored_data(key: StorageKey) -> dict:
+    """Read what is in the database, bypassing the cache of the storage under test"""
+    return await DatabaseStorage().get_data(key)
+
+
+def test_write_during_flush_is_not_lost(monkeypatch):
+    monkeypatch.setattr(settings, "fsm_flush_interval", 0.01)
+    flushing = asyncio.Event()
+    session_factory = storage_module.async_session
+
+    @asynccontextmanager
+    async def slow_session():
+        flushing.set()
+        await asyncio.sleep(0.05)
+        async with session_factory() as session:
+            yield session
+
+    async def run() -> None:
+        await init_db()
+        storage = DatabaseStorage()
+        key = make_key(7001)
+        await storage.set_data(key, {"daily_hour": 8})
+        monkeypatch.setattr(storage_module, "async_session", slow_session)
+
+        # The background flush took its snapshot and is writing the first value
+        await asyncio.wait_for(flushing.wait(), 1)
+        await storage.set_data(key, {"daily_hour": 9})
+
+        for _ in range(100):
+            if not storage._dirty:
+                break
+            await asyncio.sleep(0.01)
+        monkeypatch.setattr(storage_module, "async_session", session_factory)
+
+        assert not storage._dirty
+        assert await stored_data(key) == {"daily_hour": 9}
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_explicit_flush_keeps_newer_writes_dirty(monkeypatch):
+    monkeypatch.setattr(settings, "fsm_flush_interval", 60)
+
+    async def run() -> None:
+        await init_db()
+        storage = DatabaseStorage()
+        key = make_key(7002)
+        await storage.set_data(key, {"daily_hour": 8})
+
+        flush = asyncio.create_task(storage.flush())
+        await asyncio.sleep(0)
+        await storage.set_data(key, {"daily_hour": 10})
+        await flush
+
+        assert storage._dirty == {storage.key_builder.build(key)}
+        await storage.close()
+        assert await stored_data(key) == {"daily_hour": 10}
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_close_flushes_pending_writes(monkeypatch):
+    monkeypatch.setattr(settings, "fsm_flush_interval", 60)
+
+    async def run() -> None:
+        await init_db()
+        storage = DatabaseStorage()
+        key = make_key(7003)
+        await storage.set_state(key, "SetupStates:choose_time")
+        await storage.set_data(key, {"location": "astana"})
+
+        await storage.close()
+
+        assert storage._flush_task is None
+        assert not storage._dirty
+        reader = DatabaseStorage()
+        assert await reader.get_state(key) == "SetupStates:choose_time"
+        assert await reader.get_data(key) == {"location": "astana"}
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_finished_wizard_removes_record(monkeypatch):
+    monkeypatch.setattr(settings, "fsm_flush_interval", 60)
+
+    async def run() -> None:
+        await init_db()
+        storage = DatabaseStorage()
+        key = make_key(7004)
+        await storage.set_state(key, "SetupStates:choose_time")
+        await storage.flush()
+
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+        await storage.close()
+
+        assert await DatabaseStorage().get_state(key) is None
+        await engine.dispose()
+
+    asyncio.run(run())
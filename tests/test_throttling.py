@@ -0,0 +1,125 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from aiogram.types import CallbackQuery, Chat, Message, User
+
+from bot.config import settings
+from bot.middlewares import ThrottlingMiddleware
+from bot.services import ratelimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(settings, "throttle_rate", 1.0)
+    monkeypatch.setattr(settings, "throttle_burst", 3.0)
+    monkeypatch.setattr(settings, "throttle_costs", {"/air": 2.0})
+    return clock
+
+
+def make_user(user_id: int) -> User:
+    return User(id=user_id, is_bot=False, first_name="Test")
+
+
+def make_message(user_id: int, text: str = "/start") -> Message:
+    return Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=make_user(user_id),
+        text=text,
+    )
+
+
+def deliver(middleware: ThrottlingMiddleware, event, user_id: int) -> bool:
+    """Pass the event through the middleware, True if it reached the handler"""
+    handled = []
+
+    async def handler(event, data) -> None:
+        handled.append(event)
+
+    data = {"event_from_user": make_user(user_id)}
+    asyncio.run(middleware(handler, event, data))
+    return bool(handled)
+
+
+def test_burst_passes_then_updates_are_dropped(clock):
+    middleware = ThrottlingMiddleware()
+
+    results = [deliver(middleware, make_message(1), 1) for _ in range(5)]
+
+    assert results == [True, True, True, False, False]
+
+
+def test_expensive_commands_use_more_tokens(clock):
+    middleware = ThrottlingMiddleware()
+
+    assert deliver(middleware, make_message(1, "/air@AlmatyAirBot"), 1)
+    assert not deliver(middleware, make_message(1, "/air"), 1)
+    assert deliver(middleware, make_message(1, "/start"), 1)
+
+
+def test_bucket_refills_over_time(clock):
+    middleware = ThrottlingMiddleware()
+    for _ in range(3):
+        assert deliver(middleware, make_message(1), 1)
+    assert not deliver(middleware, make_message(1), 1)
+
+    clock.now += 1.0
+    assert deliver(middleware, make_message(1), 1)
+    assert not deliver(middleware, make_message(1), 1)
+
+    # Refilled up to the burst size, not beyond
+    clock.now += 60.0
+    results = [deliver(middleware, make_message(1), 1) for _ in range(4)]
+    assert results == [True, True, True, False]
+
+
+def test_each_user_has_own_bucket(clock):
+    middleware = ThrottlingMiddleware()
+    for _ in range(4):
+        deliver(middleware, make_message(1), 1)
+
+    assert not deliver(middleware, make_message(1), 1)
+    assert deliver(middleware, make_message(2), 2)
+
+
+def test_evicted_user_starts_with_full_bucket(clock, monkeypatch):
+    monkeypatch.setattr(settings, "throttle_cache_size", 1)
+    middleware = ThrottlingMiddleware()
+    for _ in range(4):
+        deliver(middleware, make_message(1), 1)
+
+    deliver(middleware, make_message(2), 2)
+
+    assert deliver(middleware, make_message(1), 1)
+
+
+def test_dropped_callback_is_answered(clock, monkeypatch):
+    answered = []
+
+    async def answer(self, *args, **kwargs) -> None:
+        answered.append(self.id)
+
+    monkeypatch.setattr(CallbackQuery, "answer", answer)
+    middleware = ThrottlingMiddleware()
+    callbacks = [
+        CallbackQuery(id=str(i), from_user=make_user(1), chat_instance="1", data="hour_inc")
+        for i in range(4)
+    ]
+
+    results = [deliver(middleware, callback, 1) for callback in callbacks]
+
+    assert results == [True, True, True, False]
+    assert answered == ["3"]
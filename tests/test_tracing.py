@@ -0,0 +1,49 @@
+import asyncio
+
+from bot.tracing import detached_task, span, trace
+
+
+def test_detached_task_stays_out_of_the_trace():
+    async def run() -> None:
+        async def background() -> None:
+            with span("late") as late:
+                assert late is None
+
+        with trace("update") as root:
+            with span("handler"):
+                # Even while the trace is still open
+                await detached_task(background())
+
+        assert [s.name for s in root.walk()] == ["update", "handler"]
+
+    asyncio.run(run())
+
+
+def test_span_in_a_task_is_not_attached_to_a_finished_root():
+    async def run() -> None:
+        started = asyncio.Event()
+
+        async def background() -> None:
+            await started.wait()
+            with span("late") as late:
+                assert late is None
+
+        with trace("update") as root:
+            # A plain task copies the context, the finished span stays current in it
+            task = asyncio.create_task(background())
+        started.set()
+        await task
+
+        assert [s.name for s in root.walk()] == ["update"]
+
+    asyncio.run(run())
+
+
+def test_spans_nest_within_a_trace():
+    with trace("update") as root:
+        with span("db", table="users"):
+            with span("query"):
+                pass
+
+    assert [s.name for s in root.walk()] == ["update", "db", "query"]
+    assert root.children[0].tags == {"table": "users"}